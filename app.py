@@ -1,72 +1,1443 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import json, os, base64
+import json, os, re, html
 from io import BytesIO
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+from contextlib import contextmanager
+from functools import partial
 import sqlite3
+import threading
+import atexit
+import time
+import hashlib
+import hmac
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import fcntl
+except ImportError:  # Windows: hanya kunci antar-thread dalam satu proses
+    fcntl = None
 
 st.set_page_config(page_title="Dashboard Keuangan", layout="wide", initial_sidebar_state="expanded")
-st.markdown("""
-<style>    
- .block-container {
-    padding-top: 0 !important;
-    margin-top: 10px !important;  
- }
- .header-title {
-    margin-top: -20px !important;
- }
- div[data-testid="column"] {
-    margin-top: -30px !important;
- }
-</style>
-""", unsafe_allow_html=True)
 
 
 MASKOT_PATH = "maskot.png"   
-PROFILE_PLACEHOLDER = "/mnt/data/profile_placeholder.png"  
-USER_DB_FILE = "users.json"
-JURNAL_DB_FILE = "jurnal_data.json"
+PROFILE_PLACEHOLDER = "profile_placeholder.png"
+STATIC_DIR = "static"               # disajikan di app/static/ (server.enableStaticServing)
+CSS_FILE = os.path.join(STATIC_DIR, "sijang.css")
+USER_DB_FILE = "users.json"          # format lama, dibaca sekali saat migrasi lalu dihapus
+JURNAL_DB_FILE = "jurnal_data.json"   # format lama, hanya dibaca sekali saat migrasi
+DB_FILE = "sijang.db"                # buku utama + tabel pengguna
+BUKU_UTAMA = "utama"
+BUKU_DIR = "buku"                    # buku (usaha) lain: satu file SQLite per buku
 EXCEL_FILE = "data_jurnal.xlsx"
+EXCEL_MIRROR_DIR = "excel_jurnal"   # salinan Excel jurnal, satu workbook per bulan
+EXCEL_MIRROR_INTERVAL = 30          # detik antar flush otomatis
+EXCEL_MIRROR_BATCH = 200            # flush lebih awal bila perubahan tertunda sebanyak ini
+
+# ---------------------------
+# DAFTAR AKUN (bagan akun)
+# ---------------------------
+# akun -> (kategori, saldo normal). Kategori: aset, kewajiban, ekuitas,
+# pendapatan, hpp, beban. Akun di luar daftar ini diklasifikasikan lewat
+# classify_account_for_lr (lihat klasifikasi_akun).
+DAFTAR_AKUN = {
+    "Kas": ("aset", "debit"),
+    "Piutang Usaha": ("aset", "debit"),
+    "Perlengkapan": ("aset", "debit"),
+    "Peralatan": ("aset", "debit"),
+    "Akumulasi Penyusutan Peralatan": ("aset", "kredit"),
+    "Persediaan - Pakan": ("aset", "debit"),
+    "Persediaan - Bibit": ("aset", "debit"),
+    "Persediaan - Sekam & Bahan Kandang": ("aset", "debit"),
+    "Persediaan - Jangkrik": ("aset", "debit"),
+    "Utang Usaha": ("kewajiban", "kredit"),
+    "Modal": ("ekuitas", "kredit"),
+    "Penjualan": ("pendapatan", "kredit"),
+    "Pembelian": ("hpp", "debit"),
+    "HPP": ("hpp", "debit"),
+    "Beban Gaji": ("beban", "debit"),
+    "Beban Pakan": ("beban", "debit"),
+    "Beban Listrik & Air": ("beban", "debit"),
+    "Beban Transportasi": ("beban", "debit"),
+    "Beban Penyusutan Peralatan": ("beban", "debit"),
+    "Beban Perlengkapan": ("beban", "debit"),
+    "Beban Sewa": ("beban", "debit"),
+}
+KATEGORI_AKUN = ["aset", "kewajiban", "ekuitas", "pendapatan", "hpp", "beban", "lain"]
+
+NAMA_BULAN = [
+    "JANUARI", "FEBRUARI", "MARET", "APRIL", "MEI", "JUNI",
+    "JULI", "AGUSTUS", "SEPTEMBER", "OKTOBER", "NOVEMBER", "DESEMBER",
+]
+
+
+# ---------------------------
+# SHARED CACHE (lintas sesi)
+# ---------------------------
+@st.cache_resource(show_spinner=False)
+def _shared_cache():
+    """
+    Satu cache per proses server, dipakai bersama oleh semua sesi.
+    "lock" hanya menjaga kedua dict; pembangunan entri memakai kunci per key
+    ("kunci"), jadi cache miss satu key tidak menahan key lain.
+    """
+    return {"lock": threading.Lock(), "entries": {}, "kunci": {}}
 
 
-def load_data(file_name, default):
-    if os.path.exists(file_name):
+def _file_signature(paths):
+    sig = []
+    for p in paths:
         try:
-            with open(file_name, 'r') as f:
-                return json.load(f)
-        except Exception:
-            return default
-    else:
-        save_data(file_name, default)
+            stat = os.stat(p)
+            sig.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            sig.append(None)
+    return tuple(sig)
+
+
+def cached_by_signature(key, paths, loader):
+    """
+    Kembalikan hasil loader() yang di-cache bersama untuk semua sesi.
+    Cache dianggap basi bila mtime/ukuran salah satu file di `paths` berubah.
+    Hasilnya dipakai bersama, jadi jangan diubah langsung.
+    """
+    return _cached(key, _file_signature(paths), loader)
+
+
+def _cached(key, sig, loader):
+    cache = _shared_cache()
+    entry = cache["entries"].get(key)
+    if entry is not None and entry[0] == sig:
+        return entry[1]
+    with cache["lock"]:
+        kunci = cache["kunci"].setdefault(key, threading.RLock())
+    # sesi lain yang meminta key yang sama menunggu satu pembangunan ini;
+    # loader bersarang (mis. ledger -> posting) mengambil kunci key-nya sendiri
+    with kunci:
+        entry = cache["entries"].get(key)
+        if entry is not None and entry[0] == sig:
+            return entry[1]
+        data = loader()
+        with cache["lock"]:
+            cache["entries"][key] = (sig, data)
+        return data
+
+
+def invalidate_cache(key):
+    """Buang entri `key` beserta turunannya (kunci berawalan "key:")."""
+    cache = _shared_cache()
+    with cache["lock"]:
+        for k in [k for k in cache["entries"] if k == key or k.startswith(key + ":")]:
+            cache["entries"].pop(k, None)
+
+
+def baca_json(file_name, default):
+    """
+    Baca file JSON; default bila file belum ada. File rusak -> ValueError,
+    bukan diam-diam default (yang lalu akan menimpa data asli saat disimpan).
+    """
+    if not os.path.exists(file_name):
         return default
-    
-def save_data(file_name, data):
-    with open(file_name, 'w') as f:
-        json.dump(data, f, indent=4)
+    try:
+        with open(file_name, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f"File {file_name} rusak dan tidak dapat dibaca ({e}). Pulihkan dari cadangan.") from e
+
+
+_KUNCI_FILE = {}
+_KUNCI_FILE_LOCK = threading.Lock()
+
+
+@contextmanager
+def kunci_file(file_name):
+    """
+    Kunci eksklusif untuk `file_name`, berlaku antar thread dan antar proses
+    server (flock pada file pendamping `<file>.lock`). Dipakai agar penulisan
+    file yang sama dari proses lain berurutan, bukan saling menimpa.
+    """
+    with _KUNCI_FILE_LOCK:
+        lock = _KUNCI_FILE.setdefault(os.path.abspath(file_name), threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        with open(file_name + ".lock", "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+# ---------------------------
+# ASET STATIS (CSS & gambar)
+# ---------------------------
+# CSS global ada di static/sijang.css; gambar diperkecil sekali ke ukuran
+# tampilnya (2x untuk layar HiDPI) dan disimpan di static/. Dengan
+# server.enableStaticServing (.streamlit/config.toml) setiap rerun hanya
+# mengirim tag <link>/<img> kecil yang isinya di-cache browser. Tanpa static
+# serving, CSS disisipkan inline dan gambar dikirim lewat st.image.
+def _static_serving():
+    try:
+        return bool(st.get_option("server.enableStaticServing"))
+    except Exception:
+        return False
+
+
+def _url_statis(path):
+    # ?v=mtime: browser mengambil ulang hanya bila file berubah
+    return f"app/static/{os.path.relpath(path, STATIC_DIR)}?v={os.stat(path).st_mtime_ns}"
+
+
+def pasang_css():
+    if _static_serving():
+        st.markdown(f"<link rel='stylesheet' href='{_url_statis(CSS_FILE)}'>", unsafe_allow_html=True)
+        return
+    css = cached_by_signature(f"aset:{CSS_FILE}", [CSS_FILE], lambda: open(CSS_FILE, encoding="utf-8").read())
+    st.markdown(f"<style>{css}</style>", unsafe_allow_html=True)
+
+
+def gambar_tampil(path, lebar):
+    """
+    Path salinan `path` selebar 2x `lebar` piksel di STATIC_DIR. Dibuat ulang
+    hanya bila sumbernya lebih baru; hasil dicek ulang per signature file sumber.
+    """
+    def _buat():
+        from PIL import Image
+        nama, _ = os.path.splitext(os.path.basename(path))
+        tujuan = os.path.join(STATIC_DIR, f"{nama}_{lebar}.png")
+        if not os.path.exists(tujuan) or os.path.getmtime(tujuan) < os.path.getmtime(path):
+            os.makedirs(STATIC_DIR, exist_ok=True)
+            with Image.open(path) as img:
+                img.thumbnail((lebar * 2, lebar * 2), Image.LANCZOS)
+                tmp = f"{tujuan}.{os.getpid()}.tmp"
+                img.save(tmp, format="PNG", optimize=True)
+            os.replace(tmp, tujuan)
+        return tujuan
+    return cached_by_signature(f"aset:{path}:{lebar}", [path], _buat)
+
+
+def tampilkan_gambar(path, lebar, kelas=""):
+    """Tampilkan gambar selebar `lebar` px dari salinan yang sudah diperkecil."""
+    tujuan = gambar_tampil(path, lebar)
+    if _static_serving():
+        st.markdown(
+            f"<div class='{kelas}'><img src='{_url_statis(tujuan)}' width='{lebar}'></div>",
+            unsafe_allow_html=True,
+        )
+    else:
+        st.image(tujuan, width=lebar)
+
 
 def save_jurnal_to_excel(data_list, file_name=EXCEL_FILE):
+    """Tulis data_list ke file Excel; ditulis ke file sementara lalu di-rename (atomik)."""
     if not data_list:
+        if os.path.exists(file_name):
+            os.remove(file_name)
         return
     df = pd.DataFrame(data_list)
+    tmp = f"{file_name}.{os.getpid()}.{threading.get_ident()}.tmp.xlsx"
     try:
-        df.to_excel(file_name, index=False, engine='openpyxl')
+        df.to_excel(tmp, index=False, engine='xlsxwriter')
+        os.replace(tmp, file_name)
     except Exception as e:
-        st.error(f"Gagal menyimpan ke Excel: {e}")
+        # bisa berjalan di thread latar belakang (tanpa UI), jadi cukup log ke console
+        print("Gagal menyimpan ke Excel:", e)
+
+# ---------------------------
+# JURNAL STORE (SQLite)
+# ---------------------------
+# jurnal = header transaksi, posting = baris debit/kredit (N baris per transaksi,
+# total debit = total kredit). Semua laporan membaca tabel posting yang datar.
+# Setiap buku (usaha) punya file database sendiri (tabel, index, agregat, WAL
+# dan kunci tulis terpisah); pengguna dipetakan ke bukunya lewat pengguna.buku.
+# Transaksi dikenali dari uid (ULID) yang tidak pernah berubah. Hapus = tandai
+# (jurnal.dihapus / posting.dihapus); baris fisiknya dipadatkan di latar belakang.
+JURNAL_KOLOM = ["tanggal", "deskripsi", "nilai", "jenis_transaksi", "nama_toko", "user"]
+POSTING_KOLOM = ["jurnal_id", "baris", "tanggal", "deskripsi", "akun", "debit", "kredit", "jenis_transaksi", "nama_toko", "user"]
+
+JURNAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jurnal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tanggal TEXT NOT NULL,
+    deskripsi TEXT NOT NULL DEFAULT '',
+    nilai REAL NOT NULL DEFAULT 0,
+    jenis_transaksi TEXT NOT NULL DEFAULT 'Tunai',
+    nama_toko TEXT NOT NULL DEFAULT '',
+    user TEXT,
+    uid TEXT,
+    dihapus TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jurnal_tanggal ON jurnal(tanggal);
+CREATE INDEX IF NOT EXISTS idx_jurnal_nama_toko ON jurnal(nama_toko);
+CREATE TABLE IF NOT EXISTS posting (
+    jurnal_id INTEGER NOT NULL,
+    baris INTEGER NOT NULL,
+    tanggal TEXT NOT NULL,
+    akun TEXT NOT NULL,
+    debit REAL NOT NULL DEFAULT 0,
+    kredit REAL NOT NULL DEFAULT 0,
+    nama_toko TEXT NOT NULL DEFAULT '',
+    dihapus INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (jurnal_id, baris)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_posting_tanggal ON posting(tanggal);
+CREATE INDEX IF NOT EXISTS idx_posting_akun ON posting(akun, tanggal);
+CREATE TABLE IF NOT EXISTS meta (
+    kunci TEXT PRIMARY KEY,
+    nilai TEXT
+);
+CREATE TABLE IF NOT EXISTS saldo_akun (
+    akun TEXT PRIMARY KEY,
+    debit REAL NOT NULL DEFAULT 0,
+    kredit REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS rollup_bulanan (
+    akun TEXT NOT NULL,
+    periode TEXT NOT NULL,
+    debit REAL NOT NULL DEFAULT 0,
+    kredit REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (akun, periode)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_rollup_periode ON rollup_bulanan(periode);
+CREATE TABLE IF NOT EXISTS snapshot_bulan (
+    periode TEXT PRIMARY KEY,
+    dibuat TEXT
+);
+CREATE TABLE IF NOT EXISTS snapshot_saldo (
+    periode TEXT NOT NULL,
+    akun TEXT NOT NULL,
+    debit REAL NOT NULL DEFAULT 0,
+    kredit REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (periode, akun)
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO meta (kunci, nilai) VALUES ('versi_jurnal', '0');
+"""
+JURNAL_PAGE_SIZE = 50
+
+
+def normalisasi_buku(nama):
+    """Nama usaha -> kunci buku (huruf kecil, a-z0-9_-, maks 40); kosong = BUKU_UTAMA."""
+    kunci = re.sub(r"[^a-z0-9_-]+", "-", str(nama or "").strip().lower()).strip("-")[:40]
+    return kunci or BUKU_UTAMA
+
+
+def db_file(buku):
+    return DB_FILE if buku == BUKU_UTAMA else os.path.join(BUKU_DIR, f"{buku}.db")
+
+
+def daftar_buku():
+    """Semua buku yang sudah punya file database."""
+    lain = sorted(f[:-3] for f in os.listdir(BUKU_DIR) if f.endswith(".db")) if os.path.isdir(BUKU_DIR) else []
+    return [BUKU_UTAMA] + lain
+
+
+def buku_aktif():
+    """Buku milik pengguna sesi ini (diset saat login). Thread latar belakang wajib menyebut buku sendiri."""
+    return st.session_state.get("buku", BUKU_UTAMA)
+
+
+@contextmanager
+def db_conn(buku=None):
+    """
+    Koneksi SQLite singkat ke buku `buku` (default: buku sesi ini); commit
+    otomatis bila blok selesai tanpa error.
+    synchronous=FULL: setiap commit di-fsync ke WAL sebelum kembali.
+    """
+    conn = sqlite3.connect(db_file(buku or buku_aktif()), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous=FULL")
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+_ULID_ALFABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+def buat_ulid(waktu=None):
+    """
+    ID transaksi bergaya ULID: 26 karakter Crockford base32 = 48 bit waktu
+    (ms) + 80 bit acak. Urut waktu, unik antar sesi/proses tanpa koordinasi.
+    """
+    ms = int((time.time() if waktu is None else waktu) * 1000)
+    n = (ms << 80) | int.from_bytes(os.urandom(10), "big")
+    return "".join(_ULID_ALFABET[(n >> geser) & 31] for geser in range(125, -1, -5))
+
+
+def _jurnal_row(entry, nilai):
+    return tuple(
+        entry.get(k) if entry.get(k) is not None else "" for k in ["tanggal", "deskripsi"]
+    ) + (nilai,) + tuple(
+        entry.get(k) if entry.get(k) is not None else "" for k in ["jenis_transaksi", "nama_toko"]
+    ) + (entry.get("user"), entry.get("uid") or buat_ulid())
+
+
+def _entry_postings(entry):
+    """
+    Baris posting transaksi: [(akun, debit, kredit), ...]. Transaksi majemuk
+    membawa entry["baris"] = [{"akun", "debit", "kredit"}, ...]; transaksi
+    sederhana (debit_akun, kredit_akun, nilai) menjadi dua baris.
+    """
+    if entry.get("baris"):
+        return [(b["akun"], float(b.get("debit") or 0), float(b.get("kredit") or 0)) for b in entry["baris"]]
+    nilai = float(entry.get("nilai") or 0)
+    return [(entry["debit_akun"], nilai, 0.0), (entry["kredit_akun"], 0.0, nilai)]
+
+
+def validasi_entry(entry):
+    """
+    Pastikan transaksi seimbang: minimal dua baris berakun, tiap baris hanya
+    di satu sisi dan tidak negatif, total debit = total kredit. Kembalikan
+    daftar posting; ValueError bila tidak valid.
+    """
+    postings = _entry_postings(entry)
+    if len(postings) < 2:
+        raise ValueError("Transaksi minimal terdiri dari dua baris.")
+    for akun, d, k in postings:
+        if not akun:
+            raise ValueError("Setiap baris wajib memiliki akun.")
+        if d < 0 or k < 0 or (d > 0 and k > 0):
+            raise ValueError(f"Baris {akun}: isi debit ATAU kredit, tidak negatif.")
+    total_debit = sum(d for _, d, _ in postings)
+    total_kredit = sum(k for _, _, k in postings)
+    if abs(total_debit - total_kredit) > 0.005:
+        raise ValueError(f"Total debit ({total_debit:,.2f}) dan kredit ({total_kredit:,.2f}) harus sama!")
+    return postings
+
+
+def _simpan_entries(conn, entries):
+    """Tulis header + baris posting setiap transaksi (tervalidasi) dan perbarui agregat. Kembalikan uid."""
+    uids, postings = [], []
+    for e in entries:
+        baris = validasi_entry(e)
+        row = _jurnal_row(e, sum(d for _, d, _ in baris))
+        jurnal_id = conn.execute(
+            f"INSERT INTO jurnal ({', '.join(JURNAL_KOLOM)}, uid) VALUES ({', '.join('?' * (len(JURNAL_KOLOM) + 1))})",
+            row,
+        ).lastrowid
+        nama_toko = e.get("nama_toko") or ""
+        postings += [(jurnal_id, i, e["tanggal"], akun, d, k, nama_toko) for i, (akun, d, k) in enumerate(baris, 1)]
+        uids.append(row[-1])
+    conn.executemany(
+        "INSERT INTO posting (jurnal_id, baris, tanggal, akun, debit, kredit, nama_toko) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        postings,
+    )
+    _apply_agregat(conn, entries, +1)
+    return uids
+
+
+def _periode(tanggal):
+    """'YYYY-MM' dari tanggal transaksi (string ISO)."""
+    return str(tanggal)[:7]
+
+
+def _apply_agregat(conn, entries, sign=1):
+    """
+    Perbarui agregat saldo_akun dan rollup_bulanan untuk transaksi yang
+    ditambah (+1) / dihapus (-1). Posting dijumlahkan dulu per akun dan per
+    akun x bulan, jadi satu batch besar tetap hanya beberapa upsert.
+    """
+    saldo, rollup = {}, {}
+    for e in entries:
+        periode = _periode(e["tanggal"])
+        for akun, d, k in _entry_postings(e):
+            for total in (saldo.setdefault(akun, [0.0, 0.0]), rollup.setdefault((akun, periode), [0.0, 0.0])):
+                total[0] += sign * d
+                total[1] += sign * k
+    conn.executemany(
+        """
+        INSERT INTO saldo_akun (akun, debit, kredit) VALUES (?, ?, ?)
+        ON CONFLICT(akun) DO UPDATE SET
+            debit = debit + excluded.debit,
+            kredit = kredit + excluded.kredit
+        """,
+        [(akun, d, k) for akun, (d, k) in saldo.items()],
+    )
+    conn.executemany(
+        """
+        INSERT INTO rollup_bulanan (akun, periode, debit, kredit) VALUES (?, ?, ?, ?)
+        ON CONFLICT(akun, periode) DO UPDATE SET
+            debit = debit + excluded.debit,
+            kredit = kredit + excluded.kredit
+        """,
+        [(akun, periode, d, k) for (akun, periode), (d, k) in rollup.items()],
+    )
+    # Snapshot akhir bulan sejak bulan paling awal yang berubah tidak lagi valid
+    if rollup:
+        _hapus_snapshot_sejak(conn, min(periode for _, periode in rollup))
+
+
+def rebuild_saldo_akun(conn):
+    """Hitung ulang saldo_akun dari seluruh jurnal (hanya untuk migrasi/perbaikan)."""
+    conn.execute("DELETE FROM saldo_akun")
+    conn.execute(
+        """
+        INSERT INTO saldo_akun (akun, debit, kredit)
+        SELECT akun, SUM(debit), SUM(kredit) FROM posting WHERE dihapus = 0 GROUP BY akun
+        """
+    )
+
+
+def _hapus_snapshot_sejak(conn, periode):
+    conn.execute("DELETE FROM snapshot_saldo WHERE periode >= ?", (periode,))
+    conn.execute("DELETE FROM snapshot_bulan WHERE periode >= ?", (periode,))
+
+
+def _bulan_sebelum(periode):
+    tahun, bulan = int(periode[:4]), int(periode[5:7])
+    return f"{tahun - 1}-12" if bulan == 1 else f"{tahun}-{bulan - 1:02d}"
+
+
+def _pastikan_snapshot(conn, periode):
+    """
+    Pastikan snapshot saldo kumulatif akhir bulan `periode` ada. Dibangun dari
+    snapshot terdekat sebelumnya + rollup_bulanan di antaranya (bukan replay
+    jurnal). Snapshot untuk setiap bulan antara ikut disimpan.
+    """
+    if conn.execute("SELECT 1 FROM snapshot_bulan WHERE periode = ?", (periode,)).fetchone():
+        return
+    row = conn.execute("SELECT MAX(periode) FROM snapshot_bulan WHERE periode < ?", (periode,)).fetchone()
+    dasar = row[0] if row else None
+
+    saldo = {}
+    if dasar:
+        for r in conn.execute("SELECT akun, debit, kredit FROM snapshot_saldo WHERE periode = ?", (dasar,)):
+            saldo[r[0]] = [r[1], r[2]]
+
+    rollup = conn.execute(
+        "SELECT periode, akun, debit, kredit FROM rollup_bulanan "
+        "WHERE periode > ? AND periode <= ? ORDER BY periode",
+        (dasar or "", periode),
+    ).fetchall()
+
+    sekarang = datetime.now().isoformat()
+    bulan_list = sorted({r[0] for r in rollup} | {periode})
+    i = 0
+    for bulan in bulan_list:
+        while i < len(rollup) and rollup[i][0] == bulan:
+            d, k = saldo.setdefault(rollup[i][1], [0.0, 0.0])
+            saldo[rollup[i][1]] = [d + rollup[i][2], k + rollup[i][3]]
+            i += 1
+        conn.executemany(
+            "INSERT OR REPLACE INTO snapshot_saldo (periode, akun, debit, kredit) VALUES (?, ?, ?, ?)",
+            [(bulan, akun, d, k) for akun, (d, k) in saldo.items()],
+        )
+        conn.execute("INSERT OR REPLACE INTO snapshot_bulan (periode, dibuat) VALUES (?, ?)", (bulan, sekarang))
+
+
+def saldo_per_tanggal(tanggal):
+    """
+    Saldo debit/kredit kumulatif per akun per `tanggal` ('YYYY-MM-DD'):
+    snapshot akhir bulan sebelumnya + scan transaksi bulan berjalan s/d tanggal.
+    Hasil berformat trial_balance() (index = akun, kolom debit & kredit).
+    """
+    periode = _periode(tanggal)
+    dasar = _bulan_sebelum(periode)
+    with db_conn() as conn:
+        # transaksi baca biasa (snapshot konsisten); kunci tulis hanya bila
+        # snapshot bulan dasar belum ada dan memang harus dibangun
+        conn.execute("BEGIN")
+        if not conn.execute("SELECT 1 FROM snapshot_bulan WHERE periode = ?", (dasar,)).fetchone():
+            conn.commit()
+            conn.execute("BEGIN IMMEDIATE")
+            _pastikan_snapshot(conn, dasar)
+        saldo = pd.DataFrame(
+            [tuple(r) for r in conn.execute(
+                "SELECT akun, debit, kredit FROM snapshot_saldo WHERE periode = ?", (dasar,)
+            )],
+            columns=["akun", "debit", "kredit"],
+        )
+        delta = pd.DataFrame(
+            [tuple(r) for r in conn.execute(
+                "SELECT akun, SUM(debit), SUM(kredit) FROM posting "
+                "WHERE tanggal BETWEEN ? AND ? AND dihapus = 0 GROUP BY akun",
+                (f"{periode}-00", tanggal),
+            )],
+            columns=["akun", "debit", "kredit"],
+        )
+    return pd.concat([saldo, delta]).groupby("akun")[["debit", "kredit"]].sum()
+
+
+def rebuild_rollup_bulanan(conn):
+    """Hitung ulang rollup akun x bulan dari seluruh jurnal (migrasi/perbaikan)."""
+    conn.execute("DELETE FROM rollup_bulanan")
+    conn.execute(
+        """
+        INSERT INTO rollup_bulanan (akun, periode, debit, kredit)
+        SELECT akun, substr(tanggal, 1, 7), SUM(debit), SUM(kredit) FROM posting
+        WHERE dihapus = 0 GROUP BY akun, substr(tanggal, 1, 7)
+        """
+    )
+
+
+def _migrasi_jurnal_json(conn):
+    # file rusak -> ValueError, langkah migrasi tidak dicatat dan diulang setelah diperbaiki
+    data_lama = baca_json(JURNAL_DB_FILE, [])
+    _simpan_entries(conn, [e for e in data_lama if isinstance(e, dict)])
+
+
+# Langkah migrasi dijalankan berurutan, masing-masing tepat satu kali per database
+MIGRASI_DB = [
+    ("migrasi_jurnal_json", _migrasi_jurnal_json),
+    ("saldo_akun", rebuild_saldo_akun),
+    ("rollup_bulanan", rebuild_rollup_bulanan),
+    ("snapshot_saldo", lambda conn: _hapus_snapshot_sejak(conn, "")),
+    ("migrasi_inventory_json", lambda conn: _migrasi_inventory_json(conn)),
+    ("inventory_item_lokasi", lambda conn: _migrasi_inventory_item_lokasi(conn)),
+    ("jurnal_posting", lambda conn: _migrasi_jurnal_posting(conn)),
+    ("jurnal_uid", lambda conn: _migrasi_jurnal_uid(conn)),
+    ("migrasi_pengguna_json", lambda conn: _migrasi_pengguna_json(conn)),
+    ("pengguna_buku", lambda conn: _migrasi_pengguna_buku(conn)),
+    ("buku_undangan", lambda conn: _migrasi_buku_undangan(conn)),
+]
+# langkah yang hanya berlaku untuk buku utama (data JSON lama, tabel pengguna)
+MIGRASI_BUKU_UTAMA = {
+    "migrasi_jurnal_json", "migrasi_inventory_json", "migrasi_pengguna_json", "pengguna_buku", "buku_undangan",
+}
+
+# Index atas kolom yang baru ada setelah migrasi (uid/dihapus, item/lokasi).
+# Dibuat setelah langkah migrasi untuk SETIAP database: buku baru mencatat
+# langkahnya tanpa menjalankannya, jadi index tidak boleh hanya ada di langkah.
+INDEX_SCHEMA = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jurnal_uid ON jurnal(uid);
+CREATE INDEX IF NOT EXISTS idx_jurnal_dihapus ON jurnal(dihapus) WHERE dihapus IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_inventory_kartu ON inventory(item, lokasi, tanggal, id);
+"""
+
+
+@st.cache_resource(show_spinner=False)
+def init_jurnal_db(buku=BUKU_UTAMA):
+    """
+    Siapkan database satu buku sekali per proses: mode WAL, tabel + index,
+    lalu jalankan langkah MIGRASI_DB yang belum tercatat di tabel meta dan
+    lengkapi INDEX_SCHEMA.
+    Buku selain utama tidak memuat data lama (JSON) maupun tabel pengguna;
+    buku yang baru dibuat langsung berskema terbaru, langkahnya cukup dicatat.
+    """
+    path = db_file(buku)
+    baru = not os.path.exists(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(JURNAL_SCHEMA + INVENTORY_SCHEMA + (PENGGUNA_SCHEMA if buku == BUKU_UTAMA else ""))
+        for kunci, langkah in MIGRASI_DB:
+            with conn:
+                if conn.execute("SELECT 1 FROM meta WHERE kunci = ?", (kunci,)).fetchone():
+                    continue
+                if buku == BUKU_UTAMA or not (baru or kunci in MIGRASI_BUKU_UTAMA):
+                    langkah(conn)
+                conn.execute("INSERT INTO meta (kunci, nilai) VALUES (?, ?)", (kunci, datetime.now().isoformat()))
+        conn.executescript(INDEX_SCHEMA)
+        if buku == BUKU_UTAMA:
+            _hapus_users_json(conn)
+    finally:
+        conn.close()
+    return True
+
+
+def _migrasi_jurnal_posting(conn):
+    """Database lama (satu pasang debit/kredit per baris jurnal): pindahkan ke tabel posting."""
+    kolom = {r[1] for r in conn.execute("PRAGMA table_info(jurnal)")}
+    if "debit_akun" not in kolom:
+        return
+    conn.execute(
+        """
+        INSERT INTO posting (jurnal_id, baris, tanggal, akun, debit, kredit, nama_toko)
+        SELECT id, 1, tanggal, debit_akun, nilai, 0, nama_toko FROM jurnal
+        UNION ALL
+        SELECT id, 2, tanggal, kredit_akun, 0, nilai, nama_toko FROM jurnal
+        """
+    )
+    conn.execute("DROP INDEX IF EXISTS idx_jurnal_debit_akun")
+    conn.execute("DROP INDEX IF EXISTS idx_jurnal_kredit_akun")
+    conn.execute("ALTER TABLE jurnal DROP COLUMN debit_akun")
+    conn.execute("ALTER TABLE jurnal DROP COLUMN kredit_akun")
+
+
+def _migrasi_jurnal_uid(conn):
+    """Tambah uid (ULID, dari tanggal transaksi) + kolom tanda hapus pada database lama."""
+    kolom_jurnal = {r[1] for r in conn.execute("PRAGMA table_info(jurnal)")}
+    for kolom in ("uid", "dihapus"):
+        if kolom not in kolom_jurnal:
+            conn.execute(f"ALTER TABLE jurnal ADD COLUMN {kolom} TEXT")
+    if "dihapus" not in {r[1] for r in conn.execute("PRAGMA table_info(posting)")}:
+        conn.execute("ALTER TABLE posting ADD COLUMN dihapus INTEGER NOT NULL DEFAULT 0")
+    tanpa_uid = conn.execute("SELECT id, tanggal FROM jurnal WHERE uid IS NULL ORDER BY id").fetchall()
+    waktu = pd.to_datetime(pd.Series([r["tanggal"] for r in tanpa_uid], dtype=object), errors="coerce")
+    conn.executemany(
+        "UPDATE jurnal SET uid = ? WHERE id = ?",
+        [(buat_ulid(None if pd.isna(w) else w.timestamp()), r["id"]) for r, w in zip(tanpa_uid, waktu)],
+    )
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_jurnal_uid ON jurnal(uid)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jurnal_dihapus ON jurnal(dihapus) WHERE dihapus IS NOT NULL")
+
+
+# posting + kolom header, format datar untuk laporan & mirror Excel (tanpa yang dihapus)
+POSTING_SQL = """
+SELECT p.jurnal_id, p.baris, p.tanggal, j.deskripsi, p.akun, p.debit, p.kredit,
+       j.jenis_transaksi, p.nama_toko, j.user
+FROM posting p JOIN jurnal j ON j.id = p.jurnal_id
+WHERE p.dihapus = 0
+"""
+
+
+def posting_load_all(buku):
+    with db_conn(buku) as conn:
+        rows = conn.execute(POSTING_SQL + "ORDER BY p.jurnal_id, p.baris").fetchall()
+    return [tuple(r) for r in rows]
+
+
+def _bump_versi_jurnal(conn):
+    conn.execute("UPDATE meta SET nilai = CAST(nilai AS INTEGER) + 1 WHERE kunci = 'versi_jurnal'")
+
+
+def jurnal_version(buku=None):
+    """Penghitung versi jurnal satu buku; naik satu setiap ada insert/delete dari proses mana pun."""
+    with db_conn(buku) as conn:
+        row = conn.execute("SELECT nilai FROM meta WHERE kunci = 'versi_jurnal'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def cached_by_jurnal_version(buku, key, loader):
+    """
+    Seperti cached_by_signature, tetapi kuncinya versi jurnal buku `buku`.
+    Satu entri per buku dipakai bersama semua sesi buku itu ("<buku>/<key>").
+    `buku` selalu eksplisit: loader bisa berjalan di luar sesi (mis. unduhan
+    tertunda di thread worker), tempat session_state tidak tersedia.
+    """
+    return _cached(f"{buku}/{key}", jurnal_version(buku), loader)
+
+
+def jurnal_insert(entry):
+    """Simpan satu transaksi (header + baris posting), kembalikan uid-nya. ValueError bila tidak seimbang."""
+    with db_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        (uid,) = _simpan_entries(conn, [entry])
+        _bump_versi_jurnal(conn)
+    _setelah_tulis_jurnal([entry.get("tanggal")])
+    return uid
+
+
+def jurnal_insert_many(entries, mirror=True):
+    """
+    Simpan banyak transaksi dalam SATU transaksi database (executemany +
+    agregat per batch, versi jurnal naik sekali). Kembalikan jumlah baris.
+    mirror=False: pemanggil sendiri yang menandai bulan untuk mirror Excel
+    (import besar, agar thread mirror tidak menulis ulang di tengah import).
+    """
+    entries = list(entries)
+    if not entries:
+        return 0
+    with db_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        _simpan_entries(conn, entries)
+        _bump_versi_jurnal(conn)
+    _setelah_tulis_jurnal([e.get("tanggal") for e in entries] if mirror else [])
+    return len(entries)
+
+
+def jurnal_delete_many(uids):
+    """
+    Hapus beberapa transaksi berdasarkan uid dalam satu transaksi database.
+    Hanya menandai (tombstone) lewat index uid; uid yang sudah dihapus sesi
+    atau proses lain dilewati. Kembalikan jumlah yang benar-benar dihapus
+    (lebih kecil dari len(uids) = tampilan pemanggil sudah basi).
+    Baris fisik dibuang oleh kompaksi_jurnal.
+    """
+    dihapus = datetime.now().isoformat()
+    with db_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        terhapus = []
+        for uid in uids:
+            row = conn.execute(
+                "UPDATE jurnal SET dihapus = ? WHERE uid = ? AND dihapus IS NULL RETURNING id", (dihapus, str(uid))
+            ).fetchone()
+            if row is None:
+                continue
+            baris = conn.execute(
+                "UPDATE posting SET dihapus = 1 WHERE jurnal_id = ? RETURNING tanggal, akun, debit, kredit",
+                (row["id"],),
+            ).fetchall()
+            if baris:
+                terhapus.append({"tanggal": baris[0]["tanggal"], "baris": [dict(b) for b in baris]})
+        _apply_agregat(conn, terhapus, -1)
+        if terhapus:
+            _bump_versi_jurnal(conn)
+    _setelah_tulis_jurnal([e["tanggal"] for e in terhapus])
+    return len(terhapus)
+
+
+def _setelah_tulis_jurnal(tanggal_list):
+    """Dipanggil setelah commit insert/delete: buang cache buku ini, antrekan mirror Excel."""
+    invalidate_cache(f"{buku_aktif()}/jurnal")
+    excel_mirror_mark(tanggal_list)
+
+
+def _jurnal_filter_sql(tgl_awal=None, tgl_akhir=None, akun=None):
+    kondisi, params = ["dihapus IS NULL"], []
+    if tgl_awal:
+        kondisi.append("tanggal >= ?")
+        params.append(tgl_awal)
+    if tgl_akhir:
+        kondisi.append("tanggal <= ?")
+        params.append(tgl_akhir)
+    if akun:
+        kondisi.append("EXISTS (SELECT 1 FROM posting p WHERE p.jurnal_id = jurnal.id AND p.akun = ?)")
+        params.append(akun)
+    return "WHERE " + " AND ".join(kondisi), params
+
+
+def jurnal_count(tgl_awal=None, tgl_akhir=None, akun=None):
+    where, params = _jurnal_filter_sql(tgl_awal, tgl_akhir, akun)
+    with db_conn() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM jurnal {where}", params).fetchone()[0]
+
+
+def jurnal_query(tgl_awal=None, tgl_akhir=None, akun=None, limit=JURNAL_PAGE_SIZE, offset=0):
+    """
+    Satu halaman transaksi (terbaru dulu) sesuai filter tanggal/akun.
+    debit_akun/kredit_akun = daftar akun sisi debit/kredit dari baris posting.
+    """
+    where, params = _jurnal_filter_sql(tgl_awal, tgl_akhir, akun)
+    sisi = "(SELECT group_concat(akun, ', ') FROM posting p WHERE p.jurnal_id = jurnal.id AND p.{} > 0)"
+    with db_conn() as conn:
+        rows = conn.execute(
+            f"SELECT uid, {', '.join(JURNAL_KOLOM)}, {sisi.format('debit')} AS debit_akun, "
+            f"{sisi.format('kredit')} AS kredit_akun FROM jurnal {where} "
+            "ORDER BY tanggal DESC, id DESC LIMIT ? OFFSET ?",
+            params + [int(limit), int(offset)],
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def trial_balance(buku):
+    """
+    Neraca saldo: total debit & kredit per akun (index = akun), dibaca dari
+    agregat saldo_akun yang diperbarui setiap insert/delete, bukan dari jurnal.
+    """
+    def _baca():
+        with db_conn(buku) as conn:
+            rows = conn.execute("SELECT akun, debit, kredit FROM saldo_akun").fetchall()
+        return pd.DataFrame([tuple(r) for r in rows], columns=["akun", "debit", "kredit"]).set_index("akun")
+
+    return cached_by_jurnal_version(buku, "jurnal:saldo", _baca)
 
-def load_jurnal_df():
-    if "jurnal_data" not in st.session_state:
-        return pd.DataFrame()
-    df = pd.DataFrame(st.session_state["jurnal_data"])
 
+# ---------------------------
+# KOMPAKSI JURNAL (latar belakang)
+# ---------------------------
+# Transaksi yang dihapus hanya ditandai; thread latar belakang membuang baris
+# fisiknya setiap KOMPAKSI_INTERVAL detik setelah berumur JURNAL_TOMBSTONE_UMUR
+# detik. Agregat sudah dikurangi saat tanda hapus dipasang, jadi kompaksi tidak
+# mengubah laporan dan tidak menaikkan versi jurnal.
+#
+# Setiap commit ditambahkan ke WAL (sijang.db-wal, append-only, di-fsync);
+# thread yang sama melipat WAL ke file database (checkpoint) agar WAL tetap
+# kecil dan pembukaan database hanya membaca sisa WAL yang pendek.
+KOMPAKSI_INTERVAL = 600
+JURNAL_TOMBSTONE_UMUR = 3600
+
+
+def kompaksi_jurnal(umur=JURNAL_TOMBSTONE_UMUR, buku=None):
+    """Hapus fisik transaksi bertanda hapus yang lebih tua dari `umur` detik. Kembalikan jumlahnya."""
+    batas = (datetime.now() - timedelta(seconds=umur)).isoformat()
+    with db_conn(buku) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "DELETE FROM posting WHERE jurnal_id IN (SELECT id FROM jurnal WHERE dihapus IS NOT NULL AND dihapus < ?)",
+            (batas,),
+        )
+        return conn.execute("DELETE FROM jurnal WHERE dihapus IS NOT NULL AND dihapus < ?", (batas,)).rowcount
+
+
+def checkpoint_wal(buku=BUKU_UTAMA):
+    """Lipat WAL ke file database lalu kosongkan (PRAGMA wal_checkpoint(TRUNCATE))."""
+    conn = sqlite3.connect(db_file(buku), timeout=30)
+    try:
+        return tuple(conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone())
+    finally:
+        conn.close()
+
+
+def _kompaksi_worker():
+    while True:
+        time.sleep(KOMPAKSI_INTERVAL)
+        for buku in daftar_buku():
+            try:
+                kompaksi_jurnal(buku=buku)
+                checkpoint_wal(buku)
+            except Exception as e:
+                print(f"Kompaksi jurnal buku {buku} gagal:", e)
+
+
+@st.cache_resource(show_spinner=False)
+def _kompaksi_jurnal_thread():
+    threading.Thread(target=_kompaksi_worker, name="jurnal-kompaksi", daemon=True).start()
+    return True
+
+
+# ---------------------------
+# INVENTORY STORE (SQLite)
+# ---------------------------
+# Satu kartu persediaan (average cost) per item x lokasi, diurutkan per
+# (tanggal, id). State berjalan (saldo qty, saldo Rp, harga rata-rata) tiap
+# kartu disimpan di kartu_state untuk record terakhir, dan di kartu_checkpoint
+# setiap INVENTORY_CHECKPOINT_K record. Tambah transaksi di akhir = O(1);
+# transaksi mundur tanggal atau hapus hanya menghitung ulang kartu itu dari
+# checkpoint terdekat sebelum titik perubahan.
+INVENTORY_FILE = "inventory_data.json"
+INVENTORY_CHECKPOINT_K = 100
+INVENTORY_PAGE_SIZE = 50
+INVENTORY_ITEM = [a.split(" - ", 1)[1] for a in DAFTAR_AKUN if a.startswith("Persediaan - ")]
+INVENTORY_LOKASI = ["Gudang", "Kandang A", "Kandang B"]
+# item/lokasi untuk record lama (inventory_data.json satu kartu)
+INVENTORY_ITEM_DEFAULT = "Jangkrik"
+INVENTORY_LOKASI_DEFAULT = "Gudang"
+
+INVENTORY_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS inventory (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tanggal TEXT NOT NULL,
+    keterangan TEXT NOT NULL DEFAULT '',
+    tipe TEXT NOT NULL,
+    qty INTEGER NOT NULL DEFAULT 0,
+    nilai INTEGER NOT NULL DEFAULT 0,
+    item TEXT NOT NULL DEFAULT '{INVENTORY_ITEM_DEFAULT}',
+    lokasi TEXT NOT NULL DEFAULT '{INVENTORY_LOKASI_DEFAULT}'
+);
+CREATE TABLE IF NOT EXISTS kartu_checkpoint (
+    item TEXT NOT NULL,
+    lokasi TEXT NOT NULL,
+    tanggal TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    urutan INTEGER NOT NULL,
+    saldo_qty INTEGER NOT NULL,
+    saldo_rp INTEGER NOT NULL,
+    avg_cost INTEGER NOT NULL,
+    PRIMARY KEY (item, lokasi, tanggal, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_kartu_checkpoint_urutan ON kartu_checkpoint(item, lokasi, urutan);
+CREATE TABLE IF NOT EXISTS kartu_state (
+    item TEXT NOT NULL,
+    lokasi TEXT NOT NULL,
+    tanggal TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    urutan INTEGER NOT NULL,
+    saldo_qty INTEGER NOT NULL,
+    saldo_rp INTEGER NOT NULL,
+    avg_cost INTEGER NOT NULL,
+    PRIMARY KEY (item, lokasi)
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO meta (kunci, nilai) VALUES ('versi_inventory', '0');
+"""
+
+_INVENTORY_AWAL = {"tanggal": "", "id": 0, "urutan": 0, "saldo_qty": 0, "saldo_rp": 0, "avg_cost": 0}
+_POSISI_KOLOM = "tanggal, id, urutan, saldo_qty, saldo_rp, avg_cost"
+
+
+def _inventory_step(state, tipe, qty, nilai):
+    """
+    Satu langkah average cost. state = (saldo_qty, saldo_rp, avg_cost).
+    Kembalikan (state_baru, harga_unit, hpp); semua bilangan bulat.
+    """
+    saldo_qty, saldo_rp, avg_cost = state
+    harga_unit, hpp = "", ""
+    # MASUK -> update average
+    if tipe == "Masuk":
+        harga_unit = nilai // qty if qty > 0 else 0
+        saldo_rp += nilai
+        saldo_qty += qty
+        avg_cost = (saldo_rp // saldo_qty) if saldo_qty > 0 else 0
+    # KELUAR -> pakai avg cost
+    elif tipe == "Keluar":
+        harga_unit = avg_cost
+        hpp = qty * avg_cost
+        saldo_qty = max(saldo_qty - qty, 0)
+        saldo_rp = max(saldo_rp - hpp, 0)
+    return (saldo_qty, saldo_rp, avg_cost), harga_unit, hpp
+
+
+def _inventory_head(conn, item, lokasi):
+    row = conn.execute(
+        f"SELECT {_POSISI_KOLOM} FROM kartu_state WHERE item = ? AND lokasi = ?", (item, lokasi)
+    ).fetchone()
+    return dict(row) if row else dict(_INVENTORY_AWAL)
+
+
+def _inventory_simpan_posisi(conn, item, lokasi, posisi):
+    """Tulis state record terakhir kartu; simpan juga checkpoint bila urutan kelipatan K."""
+    nilai = (item, lokasi, posisi["tanggal"], posisi["id"], posisi["urutan"],
+             posisi["saldo_qty"], posisi["saldo_rp"], posisi["avg_cost"])
+    conn.execute(f"INSERT OR REPLACE INTO kartu_state (item, lokasi, {_POSISI_KOLOM}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", nilai)
+    if posisi["urutan"] and posisi["urutan"] % INVENTORY_CHECKPOINT_K == 0:
+        conn.execute(
+            f"INSERT OR REPLACE INTO kartu_checkpoint (item, lokasi, {_POSISI_KOLOM}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            nilai,
+        )
+
+
+def _inventory_lanjut(posisi, r):
+    state, _, _ = _inventory_step(
+        (posisi["saldo_qty"], posisi["saldo_rp"], posisi["avg_cost"]), r["tipe"], r["qty"], r["nilai"]
+    )
+    return {"tanggal": r["tanggal"], "id": r["id"], "urutan": posisi["urutan"] + 1,
+            "saldo_qty": state[0], "saldo_rp": state[1], "avg_cost": state[2]}
+
+
+def _inventory_replay(conn, item, lokasi, tanggal="", record_id=0):
+    """
+    Hitung ulang checkpoint + state akhir satu kartu untuk semua record
+    pada/sesudah (tanggal, record_id), mulai dari checkpoint terdekat sebelumnya.
+    """
+    conn.execute(
+        "DELETE FROM kartu_checkpoint WHERE item = ? AND lokasi = ? AND (tanggal, id) >= (?, ?)",
+        (item, lokasi, tanggal, record_id),
+    )
+    cp = conn.execute(
+        f"SELECT {_POSISI_KOLOM} FROM kartu_checkpoint WHERE item = ? AND lokasi = ? "
+        "ORDER BY tanggal DESC, id DESC LIMIT 1",
+        (item, lokasi),
+    ).fetchone()
+    posisi = dict(cp) if cp else dict(_INVENTORY_AWAL)
+    rows = conn.execute(
+        "SELECT id, tanggal, tipe, qty, nilai FROM inventory "
+        "WHERE item = ? AND lokasi = ? AND (tanggal, id) > (?, ?) ORDER BY tanggal, id",
+        (item, lokasi, posisi["tanggal"], posisi["id"]),
+    )
+    for r in rows:
+        posisi = _inventory_lanjut(posisi, r)
+        if posisi["urutan"] % INVENTORY_CHECKPOINT_K == 0:
+            _inventory_simpan_posisi(conn, item, lokasi, posisi)
+    if posisi["urutan"]:
+        _inventory_simpan_posisi(conn, item, lokasi, posisi)
+    else:
+        conn.execute("DELETE FROM kartu_state WHERE item = ? AND lokasi = ?", (item, lokasi))
+
+
+def _inventory_replay_semua(conn):
+    """Bangun ulang state + checkpoint semua kartu (migrasi/perbaikan)."""
+    conn.execute("DELETE FROM kartu_checkpoint")
+    conn.execute("DELETE FROM kartu_state")
+    for item, lokasi in conn.execute("SELECT DISTINCT item, lokasi FROM inventory").fetchall():
+        _inventory_replay(conn, item, lokasi)
+
+
+def _migrasi_inventory_json(conn):
+    records = baca_json(INVENTORY_FILE, {}).get("Records", [])
+    conn.executemany(
+        "INSERT INTO inventory (tanggal, keterangan, tipe, qty, nilai, item, lokasi) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [_inventory_row(r) for r in records if isinstance(r, dict)],
+    )
+
+
+def _migrasi_inventory_item_lokasi(conn):
+    """Database dari versi satu-kartu: tambah kolom item/lokasi, ganti tabel state per kartu."""
+    kolom = {r[1] for r in conn.execute("PRAGMA table_info(inventory)")}
+    if "item" not in kolom:
+        conn.execute(f"ALTER TABLE inventory ADD COLUMN item TEXT NOT NULL DEFAULT '{INVENTORY_ITEM_DEFAULT}'")
+    if "lokasi" not in kolom:
+        conn.execute(f"ALTER TABLE inventory ADD COLUMN lokasi TEXT NOT NULL DEFAULT '{INVENTORY_LOKASI_DEFAULT}'")
+    conn.execute("DROP TABLE IF EXISTS inventory_checkpoint")
+    conn.execute("DROP TABLE IF EXISTS inventory_state")
+    conn.execute("DROP INDEX IF EXISTS idx_inventory_urut")
+    # satu kartu = satu rentang index, tanpa memindai pergerakan item/lokasi lain
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_inventory_kartu ON inventory(item, lokasi, tanggal, id)")
+    _inventory_replay_semua(conn)
+
+
+def _inventory_row(rec):
+    def _int(v):
+        try:
+            return int(v or 0)
+        except (TypeError, ValueError):
+            return 0
+    return (str(rec.get("tanggal", "")), rec.get("keterangan", "") or "", rec.get("tipe", ""),
+            _int(rec.get("qty")), _int(rec.get("nilai")),
+            rec.get("item") or INVENTORY_ITEM_DEFAULT, rec.get("lokasi") or INVENTORY_LOKASI_DEFAULT)
+
+
+def _bump_versi_inventory(conn):
+    conn.execute("UPDATE meta SET nilai = CAST(nilai AS INTEGER) + 1 WHERE kunci = 'versi_inventory'")
+
+
+def inventory_version(buku=None):
+    """Penghitung versi persediaan satu buku; naik satu setiap ada insert/delete dari proses mana pun."""
+    with db_conn(buku) as conn:
+        row = conn.execute("SELECT nilai FROM meta WHERE kunci = 'versi_inventory'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def inventory_insert(rec):
+    """Simpan satu transaksi persediaan, kembalikan id-nya."""
+    with db_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = _inventory_row(rec)
+        tanggal, _, tipe, qty, nilai, item, lokasi = row
+        record_id = conn.execute(
+            "INSERT INTO inventory (tanggal, keterangan, tipe, qty, nilai, item, lokasi) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            row,
+        ).lastrowid
+        head = _inventory_head(conn, item, lokasi)
+        if (tanggal, record_id) > (head["tanggal"], head["id"]):
+            # record baru berada di akhir kartu: cukup lanjutkan state terakhir
+            _inventory_simpan_posisi(conn, item, lokasi, _inventory_lanjut(
+                head, {"id": record_id, "tanggal": tanggal, "tipe": tipe, "qty": qty, "nilai": nilai}
+            ))
+        else:
+            _inventory_replay(conn, item, lokasi, tanggal, record_id)
+        _bump_versi_inventory(conn)
+    return record_id
+
+
+def delete_inventory_record(record_id):
+    """Hapus satu transaksi persediaan berdasarkan id. False bila sudah dihapus sesi lain."""
+    with db_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "DELETE FROM inventory WHERE id = ? RETURNING item, lokasi, tanggal, id", (int(record_id),)
+        ).fetchone()
+        if row is not None:
+            _inventory_replay(conn, *row)
+            _bump_versi_inventory(conn)
+    return row is not None
+
+
+def inventory_saldo_akhir(item, lokasi):
+    """(jumlah record, saldo qty, saldo Rp) satu kartu dari state tersimpan, tanpa replay."""
+    with db_conn() as conn:
+        head = _inventory_head(conn, item, lokasi)
+    return head["urutan"], head["saldo_qty"], head["saldo_rp"]
+
+
+def inventory_valuasi():
+    """
+    Saldo akhir semua kartu (item x lokasi) dalam satu query + satu operasi
+    vektor: kolom item, lokasi, transaksi, saldo_qty, saldo_rp, avg_cost.
+    """
+    with db_conn() as conn:
+        rows = conn.execute(
+            "SELECT item, lokasi, urutan, saldo_qty, saldo_rp FROM kartu_state ORDER BY item, lokasi"
+        ).fetchall()
+    df = pd.DataFrame([tuple(r) for r in rows], columns=["item", "lokasi", "transaksi", "saldo_qty", "saldo_rp"])
+    # harga rata-rata nilai tersisa; 0 bila stok habis
+    df["avg_cost"] = (df["saldo_rp"] // df["saldo_qty"].where(df["saldo_qty"] > 0)).fillna(0).astype("int64")
+    return df
+
+
+def inventory_card_page(item, lokasi, halaman, per_halaman=INVENTORY_PAGE_SIZE):
+    """
+    Satu halaman kartu persediaan item x lokasi (halaman 1 = transaksi
+    terlama). Hanya record dari checkpoint terdekat s/d akhir halaman yang
+    dihitung. Kembalikan (df, daftar id record pada halaman).
+    """
+    mulai = max(int(halaman) - 1, 0) * per_halaman
+    with db_conn() as conn:
+        cp = conn.execute(
+            f"SELECT {_POSISI_KOLOM} FROM kartu_checkpoint "
+            "WHERE item = ? AND lokasi = ? AND urutan <= ? ORDER BY urutan DESC LIMIT 1",
+            (item, lokasi, mulai),
+        ).fetchone()
+        posisi = dict(cp) if cp else dict(_INVENTORY_AWAL)
+        rows = conn.execute(
+            "SELECT id, tanggal, keterangan, tipe, qty, nilai FROM inventory "
+            "WHERE item = ? AND lokasi = ? AND (tanggal, id) > (?, ?) ORDER BY tanggal, id LIMIT ?",
+            (item, lokasi, posisi["tanggal"], posisi["id"], mulai - posisi["urutan"] + per_halaman),
+        ).fetchall()
+    lewati = mulai - posisi["urutan"]
+    df, _, _ = build_inventory_average(
+        [dict(r) for r in rows], (posisi["saldo_qty"], posisi["saldo_rp"], posisi["avg_cost"])
+    )
+    return df.iloc[lewati:].reset_index(drop=True), [r["id"] for r in rows[lewati:]]
+
+
+# ---------------------------
+# PENGGUNA (SQLite)
+# ---------------------------
+# Akun ada di tabel pengguna (PRIMARY KEY username: satu lookup index per
+# login, tanpa memuat semua akun ke session). Password disimpan sebagai hash
+# scrypt ber-salt. scrypt sengaja mahal (CPU + ~16 MB RAM per hash), jadi
+# hash dihitung di thread pool berukuran tetap: lonjakan login mengantre di
+# pool, bukan menghabiskan memori server.
+# Partisi buku adalah batas akses: bergabung ke usaha yang sudah ada (termasuk
+# buku utama) wajib memakai kode undangan usaha itu, yang hanya terlihat oleh
+# anggotanya. Nama usaha baru otomatis mendapat kode undangan sendiri.
+PENGGUNA_AWAL = "admin"   # akun awal bila users.json tidak ada; password acak dicetak sekali
+SCRYPT_N, SCRYPT_R, SCRYPT_P = 2 ** 14, 8, 1
+HASH_WORKERS = min(4, os.cpu_count() or 1)
+# hash palsu untuk username tak dikenal: waktu respons sama dengan username yang ada
+_HASH_DUMMY = f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${'00' * 16}${'00' * 32}"
+
+PENGGUNA_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS pengguna (
+    username TEXT PRIMARY KEY,
+    password_hash TEXT NOT NULL,
+    dibuat TEXT NOT NULL,
+    buku TEXT NOT NULL DEFAULT '{BUKU_UTAMA}'
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS buku (
+    nama TEXT PRIMARY KEY,
+    kode_undangan TEXT NOT NULL,
+    dibuat TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def hash_password(password, salt=None, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    """Hash scrypt 'scrypt$n$r$p$salt$hash' (hex); parameternya ikut disimpan agar bisa dinaikkan kelak."""
+    salt = salt or os.urandom(16)
+    dk = hashlib.scrypt(str(password).encode("utf-8"), salt=salt, n=n, r=r, p=p, dklen=32)
+    return f"scrypt${n}${r}${p}${salt.hex()}${dk.hex()}"
+
+
+def cek_password(password, tersimpan):
+    try:
+        _, n, r, p, salt, _ = tersimpan.split("$")
+        hasil = hash_password(password, bytes.fromhex(salt), int(n), int(r), int(p))
+    except ValueError:
+        return False
+    return hmac.compare_digest(hasil, tersimpan)
+
+
+@st.cache_resource(show_spinner=False)
+def _pool_hash():
+    return ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="hash-password")
+
+
+def verifikasi_pengguna(username, password):
+    """Buku milik username bila password cocok, selain itu None."""
+    with db_conn(BUKU_UTAMA) as conn:
+        row = conn.execute("SELECT password_hash, buku FROM pengguna WHERE username = ?", (username,)).fetchone()
+    cocok = _pool_hash().submit(cek_password, password, row["password_hash"] if row else _HASH_DUMMY).result()
+    return row["buku"] if cocok and row is not None else None
+
+
+def buat_kode_undangan():
+    return secrets.token_urlsafe(9)
+
+
+def kode_undangan(buku):
+    """Kode undangan buku `buku` (untuk ditunjukkan ke anggotanya), None bila belum terdaftar."""
+    with db_conn(BUKU_UTAMA) as conn:
+        row = conn.execute("SELECT kode_undangan FROM buku WHERE nama = ?", (buku,)).fetchone()
+    return row["kode_undangan"] if row else None
+
+
+def tambah_pengguna(username, password, buku=BUKU_UTAMA, kode=""):
+    """
+    Daftarkan akun baru di buku `buku`; False bila username sudah terdaftar
+    (juga oleh proses lain). Buku yang sudah ada (termasuk utama) wajib
+    disertai kode undangannya -> ValueError bila salah; nama buku baru
+    didaftarkan sekaligus dengan kode undangan baru.
+    """
+    buku = normalisasi_buku(buku)
+    password_hash = _pool_hash().submit(hash_password, password).result()
+    dibuat = datetime.now().isoformat()
+    with db_conn(BUKU_UTAMA) as conn:
+        # kunci tulis dulu: dua pendaftar nama usaha yang sama tidak bisa sama-sama jadi "pemilik baru"
+        conn.execute("BEGIN IMMEDIATE")
+        ada = conn.execute("SELECT kode_undangan FROM buku WHERE nama = ?", (buku,)).fetchone()
+        if ada is not None and not hmac.compare_digest(str(kode or "").strip(), ada["kode_undangan"]):
+            raise ValueError(f"Usaha '{buku}' sudah terdaftar; masukkan kode undangan dari anggotanya.")
+        row = conn.execute(
+            "INSERT INTO pengguna (username, password_hash, dibuat, buku) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (username) DO NOTHING RETURNING username",
+            (username, password_hash, dibuat, buku),
+        ).fetchone()
+        if row is not None and ada is None:
+            conn.execute(
+                "INSERT INTO buku (nama, kode_undangan, dibuat) VALUES (?, ?, ?)",
+                (buku, buat_kode_undangan(), dibuat),
+            )
+    return row is not None
+
+
+def _migrasi_pengguna_json(conn):
+    """
+    users.json (password teks biasa) -> tabel pengguna berisi hash. File
+    dihapus setelah migrasi tercatat (lihat _hapus_users_json). Instalasi baru
+    tanpa users.json mendapat satu akun awal berpassword acak, bukan akun tetap.
+    """
+    data = baca_json(USER_DB_FILE, None)
+    if data is None:
+        password = secrets.token_urlsafe(12)
+        data = {PENGGUNA_AWAL: password}
+        print(f"Akun awal SIJANG: username '{PENGGUNA_AWAL}', password '{password}' (hanya ditampilkan sekali).")
+    dibuat = datetime.now().isoformat()
+    hashes = _pool_hash().map(hash_password, data.values())
+    conn.executemany(
+        "INSERT OR IGNORE INTO pengguna (username, password_hash, dibuat) VALUES (?, ?, ?)",
+        [(str(u), h, dibuat) for u, h in zip(data, hashes)],
+    )
+
+
+def _hapus_users_json(conn):
+    """Password teks biasa tidak disimpan lagi setelah migrasinya ter-commit."""
+    if not os.path.exists(USER_DB_FILE):
+        return
+    if conn.execute("SELECT 1 FROM meta WHERE kunci = 'migrasi_pengguna_json'").fetchone():
+        try:
+            os.remove(USER_DB_FILE)
+        except OSError as e:
+            print(f"{USER_DB_FILE} sudah dimigrasi tetapi gagal dihapus:", e)
+
+
+def _migrasi_pengguna_buku(conn):
+    """Tabel pengguna sebelum ada partisi buku: semua akun masuk buku utama."""
+    if "buku" not in {r[1] for r in conn.execute("PRAGMA table_info(pengguna)")}:
+        conn.execute(f"ALTER TABLE pengguna ADD COLUMN buku TEXT NOT NULL DEFAULT '{BUKU_UTAMA}'")
+
+
+def _migrasi_buku_undangan(conn):
+    """Sebelum ada kode undangan: daftarkan buku utama + setiap buku yang sudah punya anggota."""
+    nama = {BUKU_UTAMA} | {r[0] for r in conn.execute("SELECT DISTINCT buku FROM pengguna")}
+    dibuat = datetime.now().isoformat()
+    conn.executemany(
+        "INSERT OR IGNORE INTO buku (nama, kode_undangan, dibuat) VALUES (?, ?, ?)",
+        [(n, buat_kode_undangan(), dibuat) for n in sorted(nama)],
+    )
+
+
+# ---------------------------
+# MIRROR EXCEL (latar belakang)
+# ---------------------------
+# Simpan/hapus transaksi hanya menandai bulan yang berubah. Thread latar
+# belakang menulis ulang workbook bulanan (excel_jurnal/data_jurnal_YYYY-MM.xlsx,
+# buku selain utama di excel_jurnal/<buku>/)
+# setiap EXCEL_MIRROR_INTERVAL detik, atau lebih cepat bila perubahan yang
+# tertunda mencapai EXCEL_MIRROR_BATCH. Biaya tulis per flush = ukuran satu
+# bulan, bukan seluruh jurnal, dan halaman tidak pernah menunggu Excel.
+
+@st.cache_resource(show_spinner=False)
+def _excel_mirror():
+    state = {"lock": threading.Lock(), "bulan": set(), "pending": 0, "event": threading.Event()}
+    threading.Thread(target=_excel_mirror_worker, args=(state,), name="excel-mirror", daemon=True).start()
+    atexit.register(flush_excel_mirror, state)
+    return state
+
+
+def _excel_mirror_worker(state):
+    while True:
+        state["event"].wait(EXCEL_MIRROR_INTERVAL)
+        state["event"].clear()
+        flush_excel_mirror(state)
+
+
+def excel_mirror_mark(tanggal_list):
+    """Tandai bulan (di buku sesi ini) dari tanggal-tanggal ini untuk ditulis ulang pada flush berikutnya."""
+    buku = buku_aktif()
+    bulan = {(buku, str(t)[:7]) for t in tanggal_list if t}
+    if not bulan:
+        return
+    state = _excel_mirror()
+    with state["lock"]:
+        state["bulan"].update(bulan)
+        state["pending"] += len(tanggal_list)
+        if state["pending"] >= EXCEL_MIRROR_BATCH:
+            state["event"].set()
+
+
+def flush_excel_mirror(state=None):
+    state = state or _excel_mirror()
+    with state["lock"]:
+        bulan_list = sorted(state["bulan"])
+        state["bulan"].clear()
+        state["pending"] = 0
+    if not bulan_list:
+        return
+    gagal = []
+    for buku, bulan in bulan_list:
+        # satu bulan gagal (database sibuk, disk, kunci file) tidak boleh
+        # menghentikan thread mirror: catat, antrekan ulang untuk flush berikutnya
+        try:
+            _tulis_mirror_bulan(buku, bulan)
+        except Exception as e:
+            print(f"Mirror Excel buku {buku} bulan {bulan} gagal:", e)
+            gagal.append((buku, bulan))
+    if gagal:
+        with state["lock"]:
+            state["bulan"].update(gagal)
+
+
+def _tulis_mirror_bulan(buku, bulan):
+    folder = EXCEL_MIRROR_DIR if buku == BUKU_UTAMA else os.path.join(EXCEL_MIRROR_DIR, buku)
+    os.makedirs(folder, exist_ok=True)
+    file_name = os.path.join(folder, f"data_jurnal_{bulan}.xlsx")
+    # baca + tulis di bawah kunci: proses lain yang menandai bulan yang sama
+    # menulis sesudahnya dengan data yang lebih baru, bukan menimpanya dengan data lama
+    with kunci_file(file_name):
+        # rentang string 'YYYY-MM-00'..'YYYY-MM-99' memakai index tanggal
+        with db_conn(buku) as conn:
+            rows = conn.execute(
+                POSTING_SQL + "AND p.tanggal BETWEEN ? AND ? ORDER BY p.tanggal, p.jurnal_id, p.baris",
+                (f"{bulan}-00", f"{bulan}-99"),
+            ).fetchall()
+        save_jurnal_to_excel([dict(r) for r in rows], file_name=file_name)
+
+
+# ---------------------------
+# Helper: load_posting_df (DataFrame posting bertipe)
+# ---------------------------
+JURNAL_KOLOM_KATEGORI = ["jenis_transaksi", "nama_toko", "user"]
+
+
+def parse_tanggal(s, dayfirst=False, ketat=False):
+    """
+    Parse vektor ISO8601 (plus dd/mm/yyyy dan dd-mm-yyyy bila dayfirst); format
+    bebas hanya untuk sisa yang gagal, kecuali `ketat` (input pengguna: format
+    bebas bisa menebak "2025-13-01" sebagai 13 Januari). Tidak valid -> NaT.
+    """
+    tanggal = pd.to_datetime(s, format="ISO8601", errors="coerce")
+    if ketat:
+        # ISO hanya tanggal lengkap YYYY-MM-DD (boleh diikuti jam, mis. sel tanggal XLSX)
+        tanggal = tanggal.where(s.astype(str).str.match(r"\d{4}-\d{2}-\d{2}(?:[ T]|$)"))
+    ada_isi = s.notna() & s.astype(str).str.strip().ne("")
+    for fmt in (["%d/%m/%Y", "%d-%m-%Y"] if dayfirst else []) + ([] if ketat else ["mixed"]):
+        gagal = tanggal.isna() & ada_isi
+        if not gagal.any():
+            break
+        tanggal[gagal] = pd.to_datetime(s[gagal].astype(str), format=fmt, dayfirst=dayfirst, errors="coerce")
+    return tanggal
+
+
+def build_posting_df(data):
+    """
+    DataFrame posting bertipe (satu baris per baris posting) dari tuple POSTING_KOLOM:
+    - tanggal -> datetime64 (parse vektor; format bebas hanya untuk sisa yang gagal)
+    - akun, jenis_transaksi, nama_toko, user -> categorical
+    - debit/kredit -> int64 (rupiah bulat)
+    """
+    df = pd.DataFrame(data, columns=POSTING_KOLOM)
     if df.empty:
-        return pd.DataFrame()
+        return df
 
-    df["tanggal"] = pd.to_datetime(df["tanggal"], format="mixed", dayfirst=False, errors="coerce")
+    df["tanggal"] = parse_tanggal(df["tanggal"]).fillna(pd.Timestamp.today().normalize())
 
+    df["deskripsi"] = df["deskripsi"].fillna("").astype(str)
+    df["akun"] = pd.Categorical(df["akun"], categories=pd.Index(df["akun"].dropna().unique()).sort_values())
+    for c in JURNAL_KOLOM_KATEGORI:
+        df[c] = df[c].fillna("").astype(str).astype("category")
+    for c in ["debit", "kredit"]:
+        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0).round().astype("int64")
     return df
 
 
+def load_posting_df(buku):
+    """
+    DataFrame posting bertipe (lihat build_posting_df), dibangun sekali per
+    versi jurnal dan dipakai bersama oleh semua halaman/sesi. Jangan diubah
+    langsung; gunakan .copy() bila perlu memodifikasi.
+    """
+    return cached_by_jurnal_version(buku, "jurnal:posting", lambda: build_posting_df(posting_load_all(buku)))
+
+
 # ---------------------------
 # SESSION STATE INIT
 # ---------------------------
@@ -78,119 +1449,23 @@ if 'show_create_account' not in st.session_state:
     st.session_state['show_create_account'] = False
 if 'current_page' not in st.session_state:
     st.session_state['current_page'] = 'Dashboard'
-
-# Load persistent DB
-st.session_state['user_db'] = load_data(USER_DB_FILE, {"rivaldo123": "password123"})
-st.session_state['jurnal_data'] = load_data(JURNAL_DB_FILE, [])
+if 'buku' not in st.session_state:
+    st.session_state['buku'] = BUKU_UTAMA
+
+# Load persistent DB (buku utama selalu: berisi tabel pengguna)
+try:
+    init_jurnal_db()
+    init_jurnal_db(buku_aktif())
+    _kompaksi_jurnal_thread()
+except ValueError as e:
+    st.error(str(e))
+    st.stop()
 
 # ---------------------------
 # CUSTOM CSS (Modern Minimal)
 # ---------------------------
-st.markdown(
-    f"""
-    <style>
-    :root {{
-        --primary:#0b3d2e;
-        --accent: #d4af37;
-        --muted: #6b7a70;
-        --surface: #f2f7f4;
-        --card-bg: #ffffff;
-    }}
-    html, body, [class*="css"] {{
-        font-family: Inter, system-ui, -apple-system, "Segoe UI", Roboto, "Helvetica Neue", Arial;
-        background: var(--surface) !important;
-    }}
-    .header-title {{
-        color: var(--primary);
-        font-size: 44px;
-        font-weight: 800;
-        margin: 0;
-        line-height: 1.05;
-    }}
-    .header-sub {{
-        color: #253041;
-        font-size: 30px;
-        margin-top: 8px;
-        font-weight: 600;
-    }}
-    .card {{
-        background: var(--card-bg);
-        border-radius: 12px;
-        padding: 16px;
-        box-shadow: 0 6px 20px rgba(43,46,74,0.06);
-        border-left: 4px solid rgba(255,180,0,0.12);
-    }}
-    .metric {{
-        font-size: 20px;
-        font-weight: 700;
-        color: var(--primary);
-    }}
-    .metric-sub {{
-        font-size: 12px;
-        color: var(--muted);
-    }}
-    /* Sidebar buttons look */
-    /* MENGUBAH WARNA BUTTON DI SIDEBAR */
-    .stButton > button {{
-        display: block;
-        padding: 8px 10px;
-        border-radius: 8px;
-        margin: 6px 0;
-        /* WARNA HIJAU UNTUK SEMUA BUTTON */
-        background: linear-gradient(180deg, #d4f7da, #70d68f); 
-        font-weight: 700;
-        color: #0b3d2e;
-        width: 100%;
-        text-align: left;
-        border: none !important; /* Hilangkan border Streamlit default */
-    }}
-    /* WARNA BUTTON AKTIF */
-    .stButton > button:focus:not(:active) {{
-        background: linear-gradient(180deg, #51be73, #0b3d2e);
-        color: white;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.2);
-    }}
-    
-    /* Memusatkan judul login dan membuatnya lebih jelas */
-    .centered-title {{
-        text-align: center; /* Pastikan kontainer div menengahkan isinya */
-        width: 100%; /* Pastikan mengambil seluruh lebar */
-    }}
-    .centered-title > h1 {{
-        color: var(--primary); /* Warna judul login agar terlihat jelas */
-        text-shadow: 2px 2px 4px rgba(0,0,0,0.2); /* Bayangan agar lebih menonjol */
-        font-size: 50px;
-    }}
-
-    /* Menjadikan form login/input tidak transparan */
-    div[data-testid="stTextInput"], div[data-testid="stForm"] {{
-        background: none; 
-    }}
-    div[data-testid="stForm"] > div {{
-        background: white; /* Beri background putih pada form agar terlihat jelas */
-        padding: 20px;
-        border-radius: 12px;
-        box-shadow: 0 4px 12px rgba(0,0,0,0.1);
-    }}
-    
-    .maskot {{
-        max-width:220px;
-    }}
-    /* Tambahan untuk memusatkan gambar maskot secara vertikal */
-    div[data-testid="stHorizontalBlock"] > div:nth-child(1) {{
-        display: flex;
-        align-items: center;
-    }}
-
-    /* small responsive tweak */
-    @media (max-width: 680px) {{
-        .header-title {{ font-size:28px; }}
-        .header-sub {{ font-size:18px; }}
-    }}
-    </style>
-    """,
-    unsafe_allow_html=True
-)
+# Seluruh CSS ada di static/sijang.css (lihat ASET STATIS)
+pasang_css()
 
 # ---------------------------
 # AUTH FUNCTIONS
@@ -198,26 +1473,28 @@ st.markdown(
 # FUNGSI SET BACKGROUND DIHAPUS
 
 def login(input_username, input_password):
-    db = st.session_state['user_db']
-    if input_username in db and db[input_username] == input_password:
+    buku = verifikasi_pengguna(input_username, input_password)
+    if buku is not None:
         st.session_state['authenticated'] = True
         st.session_state['username'] = input_username
+        st.session_state['buku'] = buku
         st.success("Login Berhasil!")
         st.rerun()
     else:
         st.error("Username atau Password salah.")
 
-def create_account(new_username, new_password, confirm_password):
+def create_account(new_username, new_password, confirm_password, nama_buku="", kode=""):
     if not new_username or not new_password or new_password != confirm_password:
         st.error("Input tidak valid atau Password tidak cocok.")
         return
-    db = st.session_state['user_db']
-    if new_username in db:
+    try:
+        berhasil = tambah_pengguna(new_username, new_password, nama_buku, kode)
+    except ValueError as e:
+        st.error(str(e))
+        return
+    if not berhasil:
         st.error("Username sudah terdaftar.")
         return
-    db[new_username] = new_password
-    save_data(USER_DB_FILE, db)
-    st.session_state['user_db'] = db
     st.success(f"Akun **{new_username}** berhasil dibuat! Silakan Login.")
     st.session_state['show_create_account'] = False
     st.rerun()
@@ -225,6 +1502,7 @@ def create_account(new_username, new_password, confirm_password):
 def logout():
     st.session_state['authenticated'] = False
     st.session_state['username'] = None
+    st.session_state['buku'] = BUKU_UTAMA
     st.session_state['show_create_account'] = False
     st.session_state['current_page'] = 'Dashboard'
     st._rerun()
@@ -238,16 +1516,19 @@ def sidebar_menu():
         # Profile area
         colp, = st.columns([1])
         try:
-            st.image(PROFILE_PLACEHOLDER, width=84)
+            tampilkan_gambar(PROFILE_PLACEHOLDER, 84)
         except:
             st.markdown("👤")
         username_display = st.session_state['username'] or "Guest"
         st.markdown(f"**{username_display.capitalize()}**")
-        st.markdown("<div style='color:#7a7f9a;font-size:13px'>Pengguna · Aktif</div>", unsafe_allow_html=True)
+        st.markdown(f"<div style='color:#7a7f9a;font-size:13px'>Pengguna · Buku {buku_aktif()}</div>", unsafe_allow_html=True)
+        with st.expander("Undang Anggota"):
+            st.caption("Bagikan kode ini kepada orang yang boleh mengakses buku usaha ini.")
+            st.code(kode_undangan(buku_aktif()) or "-", language=None)
         st.markdown("")
 
         # Menu buttons (styled)
-        menu_items = ["Dashboard", "Jurnal Umum", "Buku Besar", "Neraca", "BP Utang", "BP Piutang", "Inventory","Laporan Laba Rugi"]
+        menu_items = ["Dashboard", "Jurnal Umum", "Buku Besar", "Neraca", "BP Utang", "BP Piutang", "Inventory","Laporan Laba Rugi", "Import Jurnal"]
         for item in menu_items:
             key = f"menu_{item.replace(' ', '_')}"
             is_active = (st.session_state.get('current_page') == item)
@@ -260,19 +1541,6 @@ def sidebar_menu():
         if st.button("Logout"):
             logout()
 
-# ---------------------------
-# SAMPLE / HELPERS FOR DASHBOARD
-# ---------------------------
-def generate_sample_data(days=180):
-    rng = pd.date_range(end=datetime.today(), periods=days)
-    base_income = np.linspace(4000000, 7000000, days) + np.random.normal(0, 200000, days)
-    base_expense = np.linspace(3000000, 3500000, days) + np.random.normal(0, 150000, days)
-    df = pd.DataFrame({"date": rng, "income": np.abs(base_income).astype(int), "expense": np.abs(base_expense).astype(int)})
-    df["balance"] = df["income"] - df["expense"]
-    return df
-
-df_sample = generate_sample_data()
-
 # ---------------------------
 # JURNAL UMUM PAGE (modernized)
 # ---------------------------
@@ -282,19 +1550,7 @@ def jurnal_umum_page():
     # ===============================
     # Daftar akun
     # ===============================
-    daftar_akun = [
-        "Kas", "Piutang Usaha", "Utang Usaha",
-        "Penjualan", "Pembelian", "Perlengkapan", "Peralatan",
-        "Persediaan - Pakan", "Persediaan - Bibit",
-        "Persediaan - Sekam & Bahan Kandang", "Persediaan - Jangkrik",
-        "HPP", "Beban Gaji", "Beban Pakan", "Beban Listrik & Air",
-        "Beban Transportasi", "Beban Penyusutan Peralatan",
-        "Beban Perlengkapan", "Beban Sewa", "Akumulasi Penyusutan Peralatan"
-    ]
-
-    # Pastikan session state aman
-    if "jurnal_data" not in st.session_state or not isinstance(st.session_state["jurnal_data"], list):
-        st.session_state["jurnal_data"] = []
+    daftar_akun = list(DAFTAR_AKUN)
 
     # ===============================
     # FORM INPUT TRANSAKSI
@@ -355,68 +1611,324 @@ def jurnal_umum_page():
             "user": st.session_state.get("username", "unknown"),
         }
 
-        st.session_state["jurnal_data"].append(new_entry)
-        save_data("jurnal_data.json", st.session_state["jurnal_data"])
+        jurnal_insert(new_entry)
 
         st.success("Transaksi berhasil disimpan!")
         st.rerun()
 
-    # ===============================
-    # TAMPILKAN TABEL JURNAL 4 KOLOM
-    # ===============================
-    st.subheader("Data Transaksi")
+    # ===============================
+    # TRANSAKSI MAJEMUK (N BARIS)
+    # ===============================
+    # mis. penjualan + HPP, atau gaji dibagi ke beberapa akun beban
+    with st.expander("➕ Transaksi Majemuk (banyak baris)"):
+        with st.form("jurnal_majemuk_form"):
+            tanggal_m = st.date_input("Tanggal Transaksi", date.today(), key="majemuk_tanggal")
+            deskripsi_m = st.text_input("Deskripsi Transaksi", key="majemuk_deskripsi")
+            baris_m = st.data_editor(
+                pd.DataFrame({"akun": [None] * 3, "debit": [0.0] * 3, "kredit": [0.0] * 3}),
+                num_rows="dynamic",
+                hide_index=True,
+                width="stretch",
+                column_config={
+                    "akun": st.column_config.SelectboxColumn("Akun", options=daftar_akun, required=True),
+                    "debit": st.column_config.NumberColumn("Debit", min_value=0.0, format="%.2f"),
+                    "kredit": st.column_config.NumberColumn("Kredit", min_value=0.0, format="%.2f"),
+                },
+                key="majemuk_baris",
+            )
+            nama_toko_m = st.text_input("Nama Supplier/Pelanggan (wajib bila ada Utang/Piutang Usaha)", key="majemuk_toko")
+            submitted_m = st.form_submit_button("SIMPAN TRANSAKSI MAJEMUK")
+
+        if submitted_m:
+            baris_m = baris_m.dropna(subset=["akun"]).fillna({"debit": 0.0, "kredit": 0.0})
+            baris_m = baris_m[(baris_m["debit"] > 0) | (baris_m["kredit"] > 0)]
+            akun_m = set(baris_m["akun"])
+            jenis_m = "Utang" if "Utang Usaha" in akun_m else "Piutang" if "Piutang Usaha" in akun_m else "Tunai"
+            if jenis_m in ["Utang", "Piutang"] and nama_toko_m.strip() == "":
+                st.error("Nama toko/pelanggan wajib diisi!")
+            else:
+                try:
+                    jurnal_insert({
+                        "tanggal": tanggal_m.strftime("%Y-%m-%d"),
+                        "deskripsi": deskripsi_m,
+                        "baris": baris_m.to_dict("records"),
+                        "jenis_transaksi": jenis_m,
+                        "nama_toko": nama_toko_m.strip(),
+                        "user": st.session_state.get("username", "unknown"),
+                    })
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    st.success("Transaksi berhasil disimpan!")
+                    st.rerun()
+
+    # ===============================
+    # TAMPILKAN TABEL JURNAL 4 KOLOM
+    # ===============================
+    st.subheader("Data Transaksi")
+
+    # Filter dijalankan di database, hanya satu halaman yang diambil
+    col_awal, col_akhir, col_akun = st.columns([2, 2, 3])
+    with col_awal:
+        tgl_awal = st.date_input("Dari Tanggal", value=None, key="filter_tgl_awal")
+    with col_akhir:
+        tgl_akhir = st.date_input("Sampai Tanggal", value=None, key="filter_tgl_akhir")
+    with col_akun:
+        akun_filter = st.selectbox("Filter Akun", ["Semua Akun"] + daftar_akun, key="filter_akun")
+
+    filter_jurnal = {
+        "tgl_awal": tgl_awal.strftime("%Y-%m-%d") if tgl_awal else None,
+        "tgl_akhir": tgl_akhir.strftime("%Y-%m-%d") if tgl_akhir else None,
+        "akun": None if akun_filter == "Semua Akun" else akun_filter,
+    }
+
+    total = jurnal_count(**filter_jurnal)
+    if total == 0:
+        st.info("Belum ada transaksi.")
+        return
+
+    jumlah_halaman = (total + JURNAL_PAGE_SIZE - 1) // JURNAL_PAGE_SIZE
+    kunci_filter = "_".join(str(v) for v in filter_jurnal.values())
+    halaman = st.number_input(
+        f"Halaman (dari {jumlah_halaman}, total {total} transaksi)",
+        min_value=1, max_value=jumlah_halaman, value=1, step=1,
+        key=f"jurnal_halaman_{kunci_filter}",
+    )
+
+    df = pd.DataFrame(jurnal_query(
+        **filter_jurnal,
+        limit=JURNAL_PAGE_SIZE,
+        offset=(int(halaman) - 1) * JURNAL_PAGE_SIZE,
+    ))
+
+    tabel = pd.DataFrame({
+        "Tanggal": df["tanggal"],
+        "Keterangan": df["deskripsi"],
+        "Debit": df["debit_akun"],
+        "Kredit": df["kredit_akun"],
+        "Nilai": format_rp_series(df["nilai"]).to_numpy(),
+        "Toko": df["nama_toko"],
+    })
+
+    pilihan = st.dataframe(
+        tabel,
+        hide_index=True,
+        width="stretch",
+        on_select="rerun",
+        selection_mode="multi-row",
+        # seleksi hanya berlaku untuk isi tabel ini: ganti halaman/filter/isi jurnal = tabel baru tanpa seleksi
+        key=f"tabel_jurnal_{kunci_filter}_{int(halaman)}_{jurnal_version(buku_aktif())}",
+    )
+
+    # Hapus lewat seleksi baris, bukan satu tombol per baris
+    ids = df["uid"].tolist()
+    ids_terpilih = [ids[i] for i in pilihan.selection.rows if i < len(ids)]
+    if st.button(f"🗑️ Hapus {len(ids_terpilih)} transaksi terpilih", disabled=not ids_terpilih):
+        jumlah = jurnal_delete_many(ids_terpilih)
+        if jumlah == len(ids_terpilih):
+            st.rerun()
+        st.warning(f"{len(ids_terpilih) - jumlah} transaksi sudah dihapus oleh pengguna lain; muat ulang tabel.")
 
-    df = pd.DataFrame(st.session_state["jurnal_data"])
+    st.markdown("<br>", unsafe_allow_html=True)
 
-    if df.empty:
-        st.info("Belum ada transaksi.")
-        return
 
-    # HEADER TABEL
-    st.markdown("""
-        <table style='width:100%; border-collapse:collapse;'>
-            <tr style='background:#0f6cd5; color:white; font-weight:bold;'>
-                <th style='padding:8px; border:1px solid #333;'>Tanggal</th>
-                <th style='padding:8px; border:1px solid #333;'>Keterangan</th>
-                <th style='padding:8px; border:1px solid #333;'>Debit</th>
-                <th style='padding:8px; border:1px solid #333;'>Kredit</th>
-                <th style='padding:8px; border:1px solid #333;'>Toko</th>
-                <th style='padding:8px; border:1px solid #333;'>Aksi</th>
-            </tr>
-        </table>
-    """, unsafe_allow_html=True)
+# ---------------------------
+# IMPORT JURNAL (CSV / XLSX)
+# ---------------------------
+# File dibaca per potongan IMPORT_CHUNK baris. Tiap potongan divalidasi
+# secara vektor, lalu baris yang valid disimpan dalam satu transaksi database
+# (jurnal_insert_many). Baris yang salah dilaporkan dengan nomor barisnya.
+IMPORT_CHUNK = 5000
+IMPORT_KOLOM = ["tanggal", "deskripsi", "debit_akun", "kredit_akun", "nilai", "nama_toko"]
+# angka teks berformat Indonesia: titik = pemisah ribuan (kelompok 3 digit), koma = desimal
+IMPORT_ANGKA_RE = r"^-?(?:\d{1,3}(?:\.\d{3})+|\d+)(?:,\d+)?$"
+IMPORT_CONTOH = [
+    ["2025-01-05", "Pembelian pakan", "Pembelian", "Utang Usaha", "250000", "Toko Pakan Jaya"],
+    ["2025-01-06", "Penjualan jangkrik", "Kas", "Penjualan", "400000", ""],
+]
+
+
+def _sel_teks(v):
+    """Sel XLSX -> teks; angka ditulis dengan koma desimal agar dibaca sama seperti angka teks."""
+    if v is None:
+        return ""
+    if isinstance(v, float):
+        return np.format_float_positional(v, trim="-").replace(".", ",")
+    return str(v)
 
-    # LOOP TAMPILKAN BARIS JURNAL
-    for i, row in df.iterrows():
 
-        debit = f"Rp {row['nilai']:,.0f}".replace(",", ".")
-        kredit = f"Rp {row['nilai']:,.0f}".replace(",", ".")
+def _baca_import(file, nama_file, chunk=IMPORT_CHUNK):
+    """Generator DataFrame (kolom teks) per potongan `chunk` baris dari CSV/XLSX."""
+    if nama_file.lower().endswith(".xlsx"):
+        from openpyxl import load_workbook
+        wb = load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = [str(h).strip() if h is not None else "" for h in next(rows, ())]
+            buf = []
+            for r in rows:
+                buf.append([_sel_teks(v) for v in r[:len(header)]])
+                if len(buf) == chunk:
+                    yield pd.DataFrame(buf, columns=header)
+                    buf = []
+            if buf:
+                yield pd.DataFrame(buf, columns=header)
+        finally:
+            wb.close()
+        return
 
-        with st.container():
-            col1, col2, col3, col4, col5, col6 = st.columns([2, 4, 2, 2, 2, 1])
+    # CSV: pemisah ditebak dari baris header (ekspor bank sering memakai ';')
+    baris_header = file.readline().decode("utf-8-sig", errors="replace")
+    file.seek(0)
+    sep = max([",", ";", "\t"], key=baris_header.count)
+    yield from pd.read_csv(
+        file, sep=sep, dtype=str, keep_default_na=False, skip_blank_lines=False,
+        encoding="utf-8-sig", chunksize=chunk,
+    )
 
-            col1.write(row["tanggal"])
-            col2.write(row["debit_akun"])
-            col3.write(debit)
-            col4.write("")
-            col5.write(row.get("nama_toko", ""))
 
-            # Tombol hapus
-            if col6.button("🗑️", key=f"hapus_debit_{i}"):
-                st.session_state["jurnal_data"].pop(i)
-                save_data("jurnal_data.json", st.session_state["jurnal_data"])
-                st.rerun()
+def validasi_import(df, baris_awal, username):
+    """
+    Validasi vektor satu potongan file import. baris_awal = nomor baris file
+    untuk baris pertama potongan. Kembalikan (entries valid, DataFrame
+    kesalahan [Baris, Kesalahan]). Baris kosong dilewati tanpa laporan.
+    """
+    df = df.reset_index(drop=True)
+    df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
+    hilang = [k for k in ("tanggal", "debit_akun", "kredit_akun") if k not in df.columns]
+    if not {"nilai", "debit", "kredit"} & set(df.columns):
+        hilang.append("nilai (atau debit & kredit)")
+    if hilang:
+        raise ValueError(f"Kolom wajib tidak ditemukan: {', '.join(hilang)}")
+
+    df = df.fillna("").astype(str).apply(lambda s: s.str.strip())
+    kosong = df.eq("").all(axis=1)
+
+    def _kolom(k):
+        return df[k] if k in df.columns else pd.Series("", index=df.index)
+
+    def _angka(k):
+        # "Rp 1.234.567,50" -> 1234567.5; format lain ("250.00", "1,234.5") ditolak, bukan ditebak
+        teks = _kolom(k).str.replace(r"^Rp\.?\s*", "", regex=True)
+        teks = teks.where(teks.str.fullmatch(IMPORT_ANGKA_RE))
+        return pd.to_numeric(teks.str.replace(".", "", regex=False).str.replace(",", ".", regex=False), errors="coerce")
+
+    tanggal = parse_tanggal(df["tanggal"], dayfirst=True, ketat=True)
+    nilai = _angka("nilai")
+    debit = _angka("debit").fillna(nilai)
+    kredit = _angka("kredit").fillna(nilai)
+    nama_toko = _kolom("nama_toko")
+    utang = df["debit_akun"].eq("Utang Usaha") | df["kredit_akun"].eq("Utang Usaha")
+    piutang = df["debit_akun"].eq("Piutang Usaha") | df["kredit_akun"].eq("Piutang Usaha")
+    jenis = pd.Series(np.select([utang, piutang], ["Utang", "Piutang"], "Tunai"), index=df.index)
+
+    salah = pd.DataFrame({
+        "tanggal kosong/tidak valid": tanggal.isna(),
+        "akun debit tidak dikenal": ~df["debit_akun"].isin(DAFTAR_AKUN),
+        "akun kredit tidak dikenal": ~df["kredit_akun"].isin(DAFTAR_AKUN),
+        "nilai bukan angka": debit.isna() | kredit.isna(),
+        "nilai harus lebih dari 0": debit.le(0) | kredit.le(0),
+        "debit dan kredit tidak sama": (debit - kredit).abs().gt(0.005),
+        "nama_toko wajib untuk Utang/Piutang": (utang | piutang) & nama_toko.eq(""),
+    })
+    salah.loc[kosong] = False
+
+    ada_salah = salah.any(axis=1)
+    salah = salah[ada_salah]
+    pesan = pd.Series("", index=salah.index)
+    for aturan in salah.columns:
+        pesan += salah[aturan].map({True: aturan + "; ", False: ""})
+    kesalahan = pd.DataFrame({"Baris": salah.index + baris_awal, "Kesalahan": pesan.str[:-2].values})
+
+    ok = ~ada_salah & ~kosong
+    valid = pd.DataFrame({
+        "tanggal": tanggal[ok].dt.strftime("%Y-%m-%d"),
+        "deskripsi": _kolom("deskripsi")[ok],
+        "debit_akun": df["debit_akun"][ok],
+        "kredit_akun": df["kredit_akun"][ok],
+        "nilai": debit[ok].astype(float),
+        "jenis_transaksi": jenis[ok],
+        "nama_toko": nama_toko[ok],
+        "user": username,
+    })
+    # zip kolom .tolist() jauh lebih cepat daripada to_dict("records") untuk kolom string
+    kolom = list(valid.columns)
+    return [dict(zip(kolom, r)) for r in zip(*(valid[k].tolist() for k in kolom))], kesalahan
+
+
+def import_jurnal(file, nama_file, username, simpan=True, progres=None):
+    """
+    Import file per potongan: validasi lalu (bila simpan) satu transaksi
+    database per potongan. Kembalikan (baris valid, DataFrame kesalahan).
+    """
+    jumlah_valid, kesalahan, bulan = 0, [], set()
+    baris_awal = 2  # baris 1 = header
+    for chunk in _baca_import(file, nama_file):
+        entries, salah = validasi_import(chunk, baris_awal, username)
+        if simpan:
+            jurnal_insert_many(entries, mirror=False)
+            bulan.update(_periode(e["tanggal"]) for e in entries)
+        jumlah_valid += len(entries)
+        kesalahan.append(salah)
+        baris_awal += len(chunk)
+        if progres:
+            progres(baris_awal - 2)
+    excel_mirror_mark(sorted(bulan))
+    kesalahan = pd.concat(kesalahan, ignore_index=True) if kesalahan else pd.DataFrame(columns=["Baris", "Kesalahan"])
+    return jumlah_valid, kesalahan
+
+
+def import_jurnal_page():
+    st.header("Import Jurnal 📥")
+    st.markdown(
+        "Unggah file **CSV** atau **XLSX** dengan kolom "
+        + ", ".join(f"`{k}`" for k in IMPORT_KOLOM)
+        + ". Sebagai ganti `nilai` boleh memakai kolom `debit` dan `kredit` (harus sama). "
+        "`nama_toko` wajib untuk transaksi Utang Usaha / Piutang Usaha. "
+        "Tanggal ditulis `2025-01-05`, `05/01/2025` atau `05-01-2025` (hari dulu); "
+        "nilai dalam format Indonesia: `250000`, `250.000` atau `Rp 1.234.567,50`."
+    )
+    st.download_button(
+        "⬇️ Unduh template CSV",
+        data=pd.DataFrame(IMPORT_CONTOH, columns=IMPORT_KOLOM).to_csv(index=False),
+        file_name="template_import_jurnal.csv",
+        mime="text/csv",
+    )
 
-        with st.container():
-            col1, col2, col3, col4, col5, _ = st.columns([2, 4, 2, 2, 2, 1])
+    berkas = st.file_uploader("File jurnal", type=["csv", "xlsx"])
+    hanya_periksa = st.checkbox("Periksa saja (tidak disimpan)")
 
-            col1.write("")
-            col2.write("  " + row["kredit_akun"])
-            col3.write("")
-            col4.write(kredit)
-            col5.write("")
+    if berkas is not None and st.button("📥 Import"):
+        status = st.empty()
+        try:
+            jumlah_valid, kesalahan = import_jurnal(
+                berkas, berkas.name, st.session_state.get("username", "unknown"),
+                simpan=not hanya_periksa,
+                progres=lambda n: status.caption(f"{n:,} baris diproses…".replace(",", ".")),
+            )
+        except ValueError as e:
+            st.error(str(e))
+            return
+        st.session_state["hasil_import"] = {
+            "file": berkas.name, "disimpan": not hanya_periksa,
+            "valid": jumlah_valid, "kesalahan": kesalahan,
+        }
 
-    st.markdown("<br>", unsafe_allow_html=True)
+    hasil = st.session_state.get("hasil_import")
+    if not hasil:
+        return
+    aksi = "disimpan" if hasil["disimpan"] else "valid (belum disimpan)"
+    st.success(f"{hasil['file']}: {hasil['valid']:,} baris {aksi}.".replace(",", "."))
+    kesalahan = hasil["kesalahan"]
+    if not kesalahan.empty:
+        st.warning(f"{len(kesalahan):,} baris ditolak.".replace(",", "."))
+        st.dataframe(kesalahan.head(1000), hide_index=True, width="stretch")
+        st.download_button(
+            "⬇️ Unduh daftar kesalahan",
+            data=kesalahan.to_csv(index=False),
+            file_name="kesalahan_import_jurnal.csv",
+            mime="text/csv",
+        )
 
 
 # ---------------------------
@@ -427,7 +1939,7 @@ def dashboard_page():
     # Tambah jarak biar tidak kepotong header
     st.markdown("<div style='padding-top: 40px;'></div>", unsafe_allow_html=True)
 
-    df = load_jurnal_df()
+    tbk = trial_balance_klasifikasi(buku_aktif())
     
     # ============================
     # MASKOT DITEMPATKAN DI SINI (SUDAH DIUBAH KE KANAN)
@@ -439,35 +1951,29 @@ def dashboard_page():
         <h1 style='text-align:left; margin-bottom:20px; font-size:40px; color:#0b3d2e;'>💰 Dashboard Keuangan</h1>
         """, unsafe_allow_html=True)
     with col_maskot:
-        # Tambah CSS untuk rata kanan pada gambar di kolom maskot
-        st.markdown("<style>.maskot-right {display: flex; justify-content: flex-end; align-items: center; height: 100%;}</style>", unsafe_allow_html=True)
-        st.markdown("<div class='maskot-right'>", unsafe_allow_html=True)
+        # rata kanan lewat kelas .maskot-right (static/sijang.css)
         try:
-            # Tingkatkan width untuk kesan 'HD' (lebih besar)
-            st.image(MASKOT_PATH, width=200)
+            # salinan 2x lebar tampil tetap tajam di layar HiDPI
+            tampilkan_gambar(MASKOT_PATH, 200, kelas="maskot-right")
         except:
             st.warning("Maskot tidak ditemukan.")
-        st.markdown("</div>", unsafe_allow_html=True)
 
 
     # ============================
     # Hitung Pemasukan & Pengeluaran Riil
     # ============================
-    if df.empty:
+    if tbk.empty:
         pemasukan_total = 0
         pengeluaran_total = 0
         saldo_total = 0
     else:
-        # Pemasukan = Kas bertambah dari Penjualan
-        pemasukan_total = df[
-            (df["debit_akun"].str.contains("Kas", case=False)) &
-            (df["kredit_akun"].str.contains("Penjualan", case=False))
-        ]["nilai"].sum()
+        total = total_per_kategori(tbk)
 
-        # Pengeluaran = semua beban + pembelian
-        pengeluaran_total = df[
-            df["debit_akun"].str.contains("Beban|Pembelian", case=False)
-        ]["nilai"].sum()
+        # Pemasukan = akun pendapatan
+        pemasukan_total = total["pendapatan"]
+
+        # Pengeluaran = semua beban + HPP/pembelian
+        pengeluaran_total = total["beban"] + total["hpp"]
 
         saldo_total = pemasukan_total - pengeluaran_total
 
@@ -480,21 +1986,21 @@ def dashboard_page():
     with c1:
         st.markdown("<div style='background:white; padding:20px; border-radius:10px; border:1px solid #ddd;'>", unsafe_allow_html=True)
         st.markdown("<div style='color:#888; font-size:14px;'>Pemasukan</div>", unsafe_allow_html=True)
-        st.markdown(f"<div style='font-size:28px; font-weight:700;'>Rp {pemasukan_total:,.0f}</div>", unsafe_allow_html=True)
+        st.markdown(f"<div style='font-size:28px; font-weight:700;'>{format_rp(pemasukan_total)}</div>", unsafe_allow_html=True)
         st.markdown("</div>", unsafe_allow_html=True)
 
     # --- Card pengeluaran ---
     with c2:
         st.markdown("<div style='background:white; padding:20px; border-radius:10px; border:1px solid #ddd;'>", unsafe_allow_html=True)
         st.markdown("<div style='color:#888; font-size:14px;'>Pengeluaran</div>", unsafe_allow_html=True)
-        st.markdown(f"<div style='font-size:28px; font-weight:700;'>Rp {pengeluaran_total:,.0f}</div>", unsafe_allow_html=True)
+        st.markdown(f"<div style='font-size:28px; font-weight:700;'>{format_rp(pengeluaran_total)}</div>", unsafe_allow_html=True)
         st.markdown("</div>", unsafe_allow_html=True)
 
     # --- Card saldo ---
     with c3:
         st.markdown("<div style='background:white; padding:20px; border-radius:10px; border:1px solid #ddd;'>", unsafe_allow_html=True)
         st.markdown("<div style='color:#888; font-size:14px;'>Saldo Kas</div>", unsafe_allow_html=True)
-        st.markdown(f"<div style='font-size:28px; font-weight:700;'>Rp {saldo_total:,.0f}</div>", unsafe_allow_html=True)
+        st.markdown(f"<div style='font-size:28px; font-weight:700;'>{format_rp(saldo_total)}</div>", unsafe_allow_html=True)
         st.markdown("</div>", unsafe_allow_html=True)
 
     st.markdown("<br>", unsafe_allow_html=True)
@@ -526,6 +2032,8 @@ def main():
             inventory_page()
         elif page == "Laporan Laba Rugi" :
             laporan_laba_rugi_page()
+        elif page == "Import Jurnal":
+            import_jurnal_page()
  
 
 
@@ -549,13 +2057,22 @@ def main():
                     new_username = st.text_input("Username Baru", key="new_user")
                     new_password = st.text_input("Password", type="password", key="new_pass")
                     confirm_password = st.text_input("Konfirmasi Password", type="password", key="conf_pass")
+                    nama_buku = st.text_input(
+                        "Nama Usaha", key="new_buku",
+                        help="Setiap usaha punya buku (jurnal & persediaan) sendiri. Kosongkan untuk buku utama.",
+                    )
+                    kode = st.text_input(
+                        "Kode Undangan", key="new_kode", type="password",
+                        help="Wajib untuk bergabung ke usaha yang sudah ada (termasuk buku utama); "
+                             "minta ke anggotanya. Kosongkan bila mendaftarkan usaha baru.",
+                    )
                     col_submit, col_back = st.columns(2)
                     with col_submit:
                         submitted = st.form_submit_button("Daftar Akun")
                     with col_back:
                         back = st.form_submit_button("Kembali ke Login")
                     if submitted:
-                        create_account(new_username, new_password, confirm_password)
+                        create_account(new_username, new_password, confirm_password, nama_buku, kode)
                     if back:
                         st.session_state['show_create_account'] = False
                         st.rerun()
@@ -573,190 +2090,241 @@ def main():
                             st.session_state['show_create_account'] = True
                             st.rerun()
 
-def export_buku_besar_to_excel(df):
-    from openpyxl import Workbook
+# ---------------------------
+# LEDGER INDEX (Buku Besar)
+# ---------------------------
+LEDGER_KOLOM = ["akun", "urutan", "tanggal", "deskripsi", "debit", "kredit", "saldo"]
+
+
+def build_ledger_index(df):
+    """
+    Buku besar dari DataFrame posting (format panjang, satu baris per posting).
+    Hasil diurutkan per akun sesuai urutan jurnal, dengan saldo berjalan
+    (debit - kredit) dihitung lewat groupby().cumsum().
+    """
+    if df.empty:
+        return pd.DataFrame(columns=LEDGER_KOLOM)
+
+    ledger = pd.DataFrame({
+        "akun": df["akun"].to_numpy(),
+        "urutan": np.arange(len(df)),
+        "tanggal": df["tanggal"].to_numpy(),
+        "deskripsi": df["deskripsi"].to_numpy(),
+        "debit": df["debit"].to_numpy(),
+        "kredit": df["kredit"].to_numpy(),
+    })
+    ledger = ledger.sort_values(["akun", "urutan"], kind="stable", ignore_index=True)
+    ledger["saldo"] = (ledger["debit"] - ledger["kredit"]).groupby(ledger["akun"], sort=False).cumsum()
+    return ledger[LEDGER_KOLOM]
+
+
+def ledger_summary(ledger):
+    """Total debit, total kredit dan saldo akhir per akun."""
+    return ledger.groupby("akun", sort=True).agg(
+        total_debit=("debit", "sum"),
+        total_kredit=("kredit", "sum"),
+        saldo_akhir=("saldo", "last"),
+    )
 
-    wb = Workbook()
-    wb.remove(wb.active)
 
-    akun_list = sorted(list(set(df['debit_akun']).union(set(df['kredit_akun']))))
+def ledger_index_shared(buku):
+    """Ledger index untuk jurnal saat ini, dibangun sekali per perubahan jurnal."""
+    return cached_by_jurnal_version(buku, "jurnal:ledger", lambda: build_ledger_index(load_posting_df(buku)))
 
-    for akun in akun_list:
-        ws = wb.create_sheet(title=akun[:31])  # Excel sheet name max 31 chars
 
-        ws.append(["Tanggal", "Keterangan", "Debit", "Kredit", "Saldo"])
+def _nama_sheet(akun, dipakai):
+    """Nama sheet Excel yang valid (maks 31 karakter, tanpa []:*?/\\) dan unik."""
+    nama = "".join("_" if c in '[]:*?/\\' else c for c in str(akun))[:31] or "Akun"
+    kandidat, n = nama, 2
+    while kandidat.lower() in dipakai:
+        akhiran = f" ({n})"
+        kandidat, n = nama[:31 - len(akhiran)] + akhiran, n + 1
+    dipakai.add(kandidat.lower())
+    return kandidat
+
+
+def export_buku_besar_to_excel(ledger):
+    """
+    Tulis Buku Besar (satu sheet per akun) dengan xlsxwriter mode constant_memory:
+    baris ditulis berurutan dan langsung di-flush ke file sementara, sehingga
+    memori tetap kecil berapa pun jumlah posting. Lebar kolom dihitung dari
+    statistik data (panjang teks/angka terbesar per akun), bukan memindai sel.
+    """
+    import xlsxwriter
 
-        saldo = 0
-        
-        # NOTE: Implementasi loop transaksi di fungsi ini hilang. 
-        # Untuk kasus ini, karena tujuannya hanya untuk menyediakan kode lengkap,
-        # saya asumsikan bagian ini adalah placeholder yang tidak krusial untuk 
-        # fungsi utama. Jika perlu, logika transaksi harus diisi di sini.
-
-        # Autofit columns
-        for col in ws.columns:
-            max_length = 0
-            col_letter = col[0].column_letter
-            for cell in col:
-                if cell.value:
-                    max_length = max(max_length, len(str(cell.value)))
-            ws.column_dimensions[col_letter].width = max_length + 3
-
-    # Simpan ke buffer
     buffer = BytesIO()
-    wb.save(buffer)
+    wb = xlsxwriter.Workbook(buffer, {"constant_memory": True})
+    fmt_header = wb.add_format({"bold": True, "bg_color": "#0f6cd5", "font_color": "white", "border": 1})
+    fmt_tanggal = wb.add_format({"num_format": "yyyy-mm-dd"})
+    fmt_rp = wb.add_format({"num_format": "#,##0"})
+    fmt_total = wb.add_format({"bold": True, "bg_color": "#ccf7d4", "num_format": "#,##0"})
+
+    header = ["Tanggal", "Keterangan", "Debit", "Kredit", "Saldo"]
+
+    if ledger.empty:
+        wb.add_worksheet("Buku Besar").write_row(0, 0, header, fmt_header)
+        wb.close()
+        buffer.seek(0)
+        return buffer
+
+    ringkasan = ledger_summary(ledger)
+    per_akun = ledger.groupby("akun", sort=True)
+    lebar_ket = ledger["deskripsi"].str.len().groupby(ledger["akun"], sort=True).max()
+    terbesar = ledger[["debit", "kredit", "saldo"]].abs().groupby(ledger["akun"], sort=True).max().max(axis=1)
+
+    # Tanggal sebagai nomor seri Excel (hari sejak 1899-12-30), dihitung sekali secara vektor
+    serial_tanggal = (ledger["tanggal"] - pd.Timestamp("1899-12-30")).dt.days.to_numpy()
+
+    dipakai = set()
+    for akun, df_akun in per_akun:
+        ws = wb.add_worksheet(_nama_sheet(akun, dipakai))
+
+        lebar_angka = len(f"{terbesar[akun]:,.0f}") + 4
+        ws.set_column(0, 0, 12)
+        ws.set_column(1, 1, max(len(header[1]), int(lebar_ket[akun] or 0)) + 3)
+        ws.set_column(2, 4, max(10, lebar_angka))
+
+        ws.write_row(0, 0, header, fmt_header)
+
+        baris = 1
+        for tgl, ket, debit, kredit, saldo in zip(
+            serial_tanggal[df_akun.index].tolist(),
+            df_akun["deskripsi"].tolist(),
+            df_akun["debit"].tolist(),
+            df_akun["kredit"].tolist(),
+            df_akun["saldo"].tolist(),
+        ):
+            ws.write_number(baris, 0, tgl, fmt_tanggal)
+            ws.write_string(baris, 1, ket)
+            if debit:
+                ws.write_number(baris, 2, debit, fmt_rp)
+            if kredit:
+                ws.write_number(baris, 3, kredit, fmt_rp)
+            ws.write_number(baris, 4, saldo, fmt_rp)
+            baris += 1
+
+        r = ringkasan.loc[akun]
+        ws.write_row(baris, 0, ["Jumlah", ""], fmt_total)
+        ws.write_row(baris, 2, [r["total_debit"], r["total_kredit"], r["saldo_akhir"]], fmt_total)
+
+    wb.close()
     buffer.seek(0)
     return buffer
 
+def buku_besar_excel_bytes(buku):
+    """
+    Isi file Buku_Besar.xlsx untuk versi jurnal saat ini. Di-cache per versi
+    jurnal, jadi unduhan berulang tanpa perubahan jurnal tidak membangun ulang.
+    """
+    return cached_by_jurnal_version(
+        buku, "jurnal:xlsx:buku_besar",
+        lambda: export_buku_besar_to_excel(ledger_index_shared(buku)).getvalue(),
+    )
+
+
+# ---------------------------
+# RENDER LAPORAN (HTML)
+# ---------------------------
+# Tabel laporan dirangkai per kolom, bukan per sel: rupiah diformat sekali per
+# Series (format_rp_series), baris <tr> dibentuk dengan penjumlahan string
+# antar-Series, lalu satu "".join untuk seluruh tabel.
+def format_rp(x):
+    """Rupiah, mis. Rp 1.234.567 (dibulatkan). None/""/NaN -> ""."""
+    if x is None or (isinstance(x, str) and x == "") or pd.isna(x):
+        return ""
+    return f"Rp {x:,.0f}".replace(",", ".")
+
+
+def format_rp_series(s, kosong_nol=False):
+    """format_rp untuk seluruh Series sekaligus; kosong_nol=True: sel bernilai 0 dikosongkan."""
+    angka = pd.to_numeric(s, errors="coerce")
+    teks = "Rp " + angka.round().fillna(0).astype("int64").map("{:,}".format).str.replace(",", ".", regex=False)
+    return teks.mask(angka.isna() | (angka == 0) if kosong_nol else angka.isna(), "")
+
+
+def escape_series(s):
+    """html.escape untuk seluruh Series (teks bebas dari pengguna, mis. deskripsi)."""
+    s = s.astype(str)
+    for asli, ganti in (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;"), ('"', "&quot;"), ("'", "&#x27;")):
+        s = s.str.replace(asli, ganti, regex=False)
+    return s
+
+
+def baris_html(kolom):
+    """
+    Series string <tr>...</tr>, satu per baris. kolom = list (atribut <td>,
+    Series isi HTML); semua Series ber-index sama.
+    """
+    baris = "<tr>"
+    for attr, isi in kolom:
+        baris = baris + f"<td {attr}>" + isi.astype(str) + "</td>"
+    return baris + "</tr>"
+
+
+def tabel_html(header, isi, table_attr="", tr_header_attr="", th_attr="", penutup=""):
+    """<table> lengkap: baris judul dari `header`, isi = string baris (hasil baris_html yang sudah digabung)."""
+    kepala = "".join(f"<th {th_attr}>{h}</th>" for h in header)
+    return f"<table {table_attr}><tr {tr_header_attr}>{kepala}</tr>{isi}{penutup}</table>"
+
+
+def render_buku_besar_html(ledger):
+    """HTML seluruh Buku Besar (judul akun, tabel, ringkasan per akun) dalam satu string."""
+    ringkasan = ledger_summary(ledger)
+    baris = baris_html([
+        ("class='row-cell'", ledger["tanggal"].dt.strftime("%Y-%m-%d")),
+        ("class='row-cell'", escape_series(ledger["deskripsi"])),
+        ("class='row-cell' style='text-align:right'", format_rp_series(ledger["debit"], kosong_nol=True)),
+        ("class='row-cell' style='text-align:right'", format_rp_series(ledger["kredit"], kosong_nol=True)),
+        ("class='row-cell' style='text-align:right'", format_rp_series(ledger["saldo"])),
+    ]).tolist()
+    bagian = []
+    # ledger sudah terurut per akun: setiap akun = satu blok baris berurutan
+    for akun, posisi in ledger.groupby("akun", sort=True, observed=True).indices.items():
+        r = ringkasan.loc[akun]
+        bagian.append(
+            f"<div class='akun-title'>{html.escape(str(akun))}</div>"
+            "<div class='tabel-container'>"
+            + tabel_html(
+                ["Tanggal", "Keterangan", "Debit", "Kredit", "Saldo"],
+                "".join(baris[posisi[0]:posisi[-1] + 1]),
+                table_attr="style='width:100%; border-collapse:collapse;'",
+                th_attr="class='table-header'",
+                penutup="<tr><td colspan='5' class='jumlah-row'>Jumlah</td></tr>",
+            )
+            + "</div>"
+            "<div style='background:#e7f3ff; padding:15px; border-radius:8px; margin-top:2px; border: 1px solid #bcdcff;'>"
+            f"<b>Total Debit:</b> {format_rp(r['total_debit'])}<br>"
+            f"<b>Total Kredit:</b> {format_rp(r['total_kredit'])}<br>"
+            f"<b>Saldo Akhir:</b> {format_rp(r['saldo_akhir'])}"
+            "</div>"
+        )
+    return "".join(bagian)
+
+
+def buku_besar_html_shared(buku):
+    """HTML Buku Besar untuk versi jurnal saat ini, dirangkai sekali per perubahan jurnal."""
+    return cached_by_jurnal_version(
+        buku, "jurnal:html:buku_besar", lambda: render_buku_besar_html(ledger_index_shared(buku))
+    )
+
+
 def buku_besar_page():
-    st.markdown("""
-    <style>
-        .judul-buku-besar {
-            font-size: 40px;
-            font-weight: 800;
-            text-align: center;
-            margin-bottom: 40px;
-        }
-        .akun-title {
-            font-size: 26px;
-            font-weight: 700;
-            margin-top: 35px;
-            margin-bottom: 10px;
-        }
-        .table-header {
-            background-color: #0f6cd5;
-            color: white;
-            font-weight: 700;
-            padding: 8px;
-            text-align: center;
-        }
-        .row-cell {
-            padding: 10px;
-            border: 1px solid #333;
-            font-size: 15px;
-        }
-        .jumlah-row {
-            background-color: #ccf7d4;
-            text-align: center;
-            font-weight: 700;
-        }
-        .tabel-container {
-            background-color: white;
-            padding: 12px;
-            border: 1px solid #ccc;
-            border-radius: 6px;
-            margin-bottom: 40px;
-        }
-    </style>
-    """, unsafe_allow_html=True)
 
     st.markdown("<div class='judul-buku-besar'>Buku Besar</div>", unsafe_allow_html=True)
 
-    data = st.session_state['jurnal_data']
-    if not data:
+    buku = buku_aktif()
+    if ledger_index_shared(buku).empty:
         st.info("Belum ada transaksi untuk Buku Besar.")
         return
 
-    df = pd.DataFrame(data)
-
-    # Ambil daftar akun unik dari debit & kredit
-    akun_list = sorted(list(set(df['debit_akun']).union(set(df['kredit_akun']))))
-
-    for akun in akun_list:
-
-        st.markdown(f"<div class='akun-title'>{akun}</div>", unsafe_allow_html=True)
-
-        rows = []
-        saldo = 0
-
-        # =============================
-        # FILTER TRANSAKSI KHUSUS AKUN INI
-        # =============================
-        df_akun = df[(df['debit_akun'] == akun) | (df['kredit_akun'] == akun)]
-
-        if df_akun.empty:
-            st.info(f"Tidak ada transaksi untuk akun {akun}.")
-            continue
-
-        for _, row in df_akun.iterrows():
-
-            debit = row['nilai'] if row['debit_akun'] == akun else ""
-            kredit = row['nilai'] if row['kredit_akun'] == akun else ""
-
-            # Hitung saldo berjalan
-            if debit != "":
-                saldo += row['nilai']
-            elif kredit != "":
-                saldo -= row['nilai']
-
-            rows.append([
-                row['tanggal'],
-                row['deskripsi'],
-                debit,
-                kredit,
-                saldo
-            ])
-
-        # =============================
-        # TABEL HTML
-        # =============================
-        html = """
-<div class='tabel-container'>
-<table style='width:100%; border-collapse:collapse;'>
-    <tr>
-        <th class='table-header'>Tanggal</th>
-        <th class='table-header'>Keterangan</th>
-        <th class='table-header'>Debit</th>
-        <th class='table-header'>Kredit</th>
-        <th class='table-header'>Saldo</th>
-    </tr>
-"""
-
-        for r in rows:
-            html += f"""
-<tr>
-    <td class='row-cell'>{r[0]}</td>
-    <td class='row-cell'>{r[1]}</td>
-    <td class='row-cell' style='text-align:right'>{format_rupiah(r[2])}</td>
-    <td class='row-cell' style='text-align:right'>{format_rupiah(r[3])}</td>
-    <td class='row-cell' style='text-align:right'>{format_rupiah(r[4])}</td>
-</tr>
-"""
-
-        html += """
-<tr>
-    <td colspan='5' class='jumlah-row'>Jumlah</td>
-</tr>
-</table>
-</div>
-"""
-
-        st.markdown(html, unsafe_allow_html=True)
-
-        # ====== RINGKASAN JUMLAH ======
-        total_debit = df_akun[df_akun['debit_akun'] == akun]['nilai'].sum()
-        total_kredit = df_akun[df_akun['kredit_akun'] == akun]['nilai'].sum()
-        saldo_akhir = total_debit - total_kredit
-
-        st.markdown(f"""
-        <div style="
-            background:#e7f3ff; 
-            padding:15px; 
-            border-radius:8px; 
-            margin-top:2px;
-            border: 1px solid #bcdcff;">
-            <b>Total Debit:</b> {format_rupiah(total_debit)}<br>
-            <b>Total Kredit:</b> {format_rupiah(total_kredit)}<br>
-            <b>Saldo Akhir:</b> {format_rupiah(saldo_akhir)}
-        </div>
-        """, unsafe_allow_html=True)
+    st.markdown(buku_besar_html_shared(buku), unsafe_allow_html=True)
 
     # ========== DOWNLOAD EXCEL ==========
-    excel_buffer = export_buku_besar_to_excel(df)
-
+    # File baru dibuat saat tombol diklik (bukan setiap render halaman).
+    # Callable dijalankan di thread worker tanpa sesi, jadi bukunya diikat sekarang.
     st.download_button(
         label="📥 Download Buku Besar (Excel)",
-        data=excel_buffer,
+        data=partial(buku_besar_excel_bytes, buku),
         file_name="Buku_Besar.xlsx",
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
@@ -766,303 +2334,181 @@ def buku_besar_page():
         st.rerun()
 
 
-def format_rupiah(x):
-    if x == "" or x is None:
-        return ""
-    return "Rp {:,}".format(int(x)).replace(",", ".")
-
 def neraca_page():
 
     st.markdown("<h1 style='text-align:center; font-weight:900;'>NERACA</h1>", unsafe_allow_html=True)
-    st.markdown("<h4 style='text-align:center; margin-top:-10px;'>PER 31 DESEMBER 2025</h4>", unsafe_allow_html=True)
+    per_tanggal = st.date_input("Per Tanggal", date.today(), key="neraca_tanggal")
+    st.markdown(
+        f"<h4 style='text-align:center; margin-top:-10px;'>PER {per_tanggal.day} "
+        f"{NAMA_BULAN[per_tanggal.month - 1]} {per_tanggal.year}</h4>",
+        unsafe_allow_html=True,
+    )
     st.write("")
 
-    daftar_akun = [
-        "Kas","Penjualan","Pembelian","Perlengkapan","Peralatan", "Utang Usaha", "Piutang Usaha", "Modal",
-        "Persediaan - Pakan","Persediaan - Bibit","Persediaan - Sekam & Bahan Kandang",
-        "Persediaan - Jangkrik","HPP","Beban Gaji","Beban Listrik & Air",
-        "Beban Transportasi","Beban Penyusutan Peralatan",
-        "Beban Perlengkapan","Beban Sewa", "Akumulasi Penyusutan Peralatan"
-    ]
-
-    data_jurnal = st.session_state.get("jurnal_data", [])
-    df = pd.DataFrame(data_jurnal) if data_jurnal else pd.DataFrame(columns=["debit_akun","kredit_akun","nilai"])
-
-    saldo_akun = {}
-    for akun in daftar_akun:
-        d = df[df["debit_akun"]==akun]["nilai"].sum() if not df.empty else 0
-        k = df[df["kredit_akun"]==akun]["nilai"].sum() if not df.empty else 0
-        saldo_akun[akun] = {"Debit": d, "Kredit": k}
-
-    # =========================
-    # TABEL HTML TANPA INDENT !!!
-    # =========================
-    html_table = "<table style='width:100%;border-collapse:collapse;margin-top:20px;'>"
-    html_table += "<tr style='background:#0077FF;color:white;font-weight:bold;'>"
-    html_table += "<th style='border:1px solid black;padding:8px;'>No</th>"
-    html_table += "<th style='border:1px solid black;padding:8px;'>Akun</th>"
-    html_table += "<th style='border:1px solid black;padding:8px;'>Debit</th>"
-    html_table += "<th style='border:1px solid black;padding:8px;'>Kredit</th>"
-    html_table += "</tr>"
-
-    no=1
-    for akun in daftar_akun:
-        d = saldo_akun[akun]["Debit"]
-        k = saldo_akun[akun]["Kredit"]
-        html_table += f"<tr>"
-        html_table += f"<td style='border:1px solid black;padding:8px;text-align:center;'>{no}</td>"
-        html_table += f"<td style='border:1px solid black;padding:8px;'>{akun}</td>"
-        html_table += f"<td style='border:1px solid black;padding:8px;text-align:right;'>Rp {d:,.0f}</td>"
-        html_table += f"<td style='border:1px solid black;padding:8px;text-align:right;'>Rp {k:,.0f}</td>"
-        html_table += "</tr>"
-        no+=1
-
-    total_d = sum(saldo_akun[a]["Debit"] for a in daftar_akun)
-    total_k = sum(saldo_akun[a]["Kredit"] for a in daftar_akun)
-
-    html_table += "<tr style='background:#BFF4FF;'>"
-    html_table += "<td colspan='2' style='border:1px solid black;padding:8px;text-align:center;font-weight:bold;'>TOTAL</td>"
-    html_table += f"<td style='border:1px solid black;padding:8px;text-align:right;font-weight:bold;'>Rp {total_d:,.0f}</td>"
-    html_table += f"<td style='border:1px solid black;padding:8px;text-align:right;font-weight:bold;'>Rp {total_k:,.0f}</td>"
-    html_table += "</tr>"
-    html_table += "</table>"
-
-    st.markdown(html_table, unsafe_allow_html=True)
-
-import io
-import pandas as pd
-from datetime import datetime
-from openpyxl import Workbook
-from io import BytesIO
+    daftar_akun = list(DAFTAR_AKUN)
+
+    tb = saldo_per_tanggal(per_tanggal.strftime("%Y-%m-%d")).reindex(daftar_akun, fill_value=0.0)
+
+    sel = "style='border:1px solid black;padding:8px;"
+    isi = "".join(baris_html([
+        (sel + "text-align:center;'", pd.Series(np.arange(1, len(tb) + 1), index=tb.index)),
+        (sel + "'", escape_series(tb.index.to_series())),
+        (sel + "text-align:right;'", format_rp_series(tb["debit"])),
+        (sel + "text-align:right;'", format_rp_series(tb["kredit"])),
+    ]).tolist())
+    total = (
+        "<tr style='background:#BFF4FF;'>"
+        f"<td colspan='2' {sel}text-align:center;font-weight:bold;'>TOTAL</td>"
+        f"<td {sel}text-align:right;font-weight:bold;'>{format_rp(tb['debit'].sum())}</td>"
+        f"<td {sel}text-align:right;font-weight:bold;'>{format_rp(tb['kredit'].sum())}</td>"
+        "</tr>"
+    )
+    st.markdown(
+        tabel_html(
+            ["No", "Akun", "Debit", "Kredit"], isi,
+            table_attr="style='width:100%;border-collapse:collapse;margin-top:20px;'",
+            tr_header_attr="style='background:#0077FF;color:white;font-weight:bold;'",
+            th_attr="style='border:1px solid black;padding:8px;'",
+            penutup=total,
+        ),
+        unsafe_allow_html=True,
+    )
 
-def format_rp(x):
-    try:
-        return "Rp {:,}".format(int(x)).replace(",", ".")
-    except:
-        return "Rp 0"
 # ===============================================================
-#   BUKU PEMBANTU UTANG — TERINTEGRASI OTOMATIS DARI JURNAL UMUM
+#   BUKU PEMBANTU UTANG/PIUTANG — TERINTEGRASI OTOMATIS DARI JURNAL UMUM
 # ===============================================================
-def bp_utang_page():
-    st.markdown("<h1 style='text-align:center;'>BUKU PEMBANTU UTANG (Per Supplier)</h1>", unsafe_allow_html=True)
-    st.write("Menampilkan utang berdasarkan transaksi Jurnal Umum (akun Utang Usaha).")
+BP_KOLOM = ["nama_toko", "tanggal", "deskripsi", "debit", "kredit", "saldo"]
 
-    # =========================
-    # LOAD JURNAL
-    # =========================
-    df = load_jurnal_df()
-    if df.empty:
-        st.info("Belum ada transaksi di jurnal.")
-        return
-
-    # =========================
-    # FILTER UTANG SAJA
-    # =========================
-    mask = (
-        (df["debit_akun"] == "Utang Usaha") |
-        (df["kredit_akun"] == "Utang Usaha") |
-        (df["jenis_transaksi"].str.lower() == "utang")
-    )
-    df_utang = df[mask].copy()
-
-    if df_utang.empty:
-        st.info("Belum ada transaksi utang.")
-        return
-
-    # =========================
-    # LIST SUPPLIER
-    # =========================
-    supplier_list = df_utang["nama_toko"].dropna().unique()
-
-    for supplier in supplier_list:
-
-        st.markdown(f"<h3 style='margin-top:35px;'><b>Supplier: {supplier}</b></h3>", unsafe_allow_html=True)
 
-        df_s = df_utang[df_utang["nama_toko"] == supplier].copy()
-        df_s.sort_values("tanggal", inplace=True)
-
-        saldo = 0
-        rows = []
-
-        # =========================
-        # HITUNG SALDO UTANG
-        # =========================
-        for _, r in df_s.iterrows():
-
-            # UTANG: kredit menambah, debit mengurangi
-            kredit = r["nilai"] if r["kredit_akun"] == "Utang Usaha" else 0
-            debit = r["nilai"] if r["debit_akun"] == "Utang Usaha" else 0
-
-            saldo = saldo + kredit - debit
-
-            rows.append({
-                "Tanggal": r["tanggal"],
-                "Keterangan": r.get("deskripsi", ""),
-                "Debit": debit,
-                "Kredit": kredit,
-                "Saldo": saldo
-            })
-
-        # =========================
-        # TABEL UTANG
-        # =========================
-        df_display = pd.DataFrame(rows)
-
-        df_display["Debit"] = df_display["Debit"].apply(lambda x: f"Rp {x:,.0f}" if x != 0 else "")
-        df_display["Kredit"] = df_display["Kredit"].apply(lambda x: f"Rp {x:,.0f}" if x != 0 else "")
-        df_display["Saldo"] = df_display["Saldo"].apply(lambda x: f"Rp {x:,.0f}")
-
-        st.table(df_display)
-
-        # =========================
-        # TOTAL UTANG
-        # =========================
-        # Perlu dikoreksi agar menggunakan nilai numerik dari rows
-        total_debit = sum([r.get("Debit", 0) for r in rows])
-        total_kredit = sum([r.get("Kredit", 0) for r in rows])
-        saldo_akhir = rows[-1]["Saldo"]
-
-        st.markdown(f"""
-        <div style='background:#fef7e7;padding:12px;border-radius:8px;margin-bottom:20px;'>
-            <b>Total Debit:</b> Rp {total_debit:,.0f} &nbsp;&nbsp;
-            <b>Total Kredit:</b> Rp {total_kredit:,.0f} &nbsp;&nbsp;
-            <b>Saldo Akhir:</b> Rp {saldo_akhir:,.0f}
-        </div>
-        """, unsafe_allow_html=True)
+def build_buku_pembantu(df, akun, saldo_normal):
+    """
+    Buku pembantu semua pihak (supplier/pelanggan) sekaligus.
 
-    if st.button("⬅ Kembali Dashboard"):
-        st.session_state['current_page'] = "Dashboard"
-        st.rerun()
+    df           : DataFrame posting (load_posting_df)
+    akun         : akun kontrol, mis. "Utang Usaha" / "Piutang Usaha"
+    saldo_normal : "kredit" (utang bertambah di kredit) atau "debit" (piutang)
 
+    Returns (detail, ringkasan):
+    - detail    : posting akun kontrol per pihak, urut tanggal, dengan saldo
+                  berjalan dari satu groupby("nama_toko").cumsum()
+    - ringkasan : per pihak (urutan kemunculan) total_debit, total_kredit, saldo_akhir
+    """
+    if df.empty:
+        return pd.DataFrame(columns=BP_KOLOM), pd.DataFrame(columns=["total_debit", "total_kredit", "saldo_akhir"])
+
+    sub = df.loc[df["akun"] == akun]
+    nama_toko = sub["nama_toko"].astype(str)
+
+    detail = pd.DataFrame({
+        "nama_toko": nama_toko.to_numpy(),
+        "tanggal": sub["tanggal"].to_numpy(),
+        "deskripsi": sub["deskripsi"].to_numpy(),
+        "debit": sub["debit"].to_numpy(),
+        "kredit": sub["kredit"].to_numpy(),
+    })
+    detail = detail.sort_values(["nama_toko", "tanggal"], kind="stable", ignore_index=True)
+    mutasi = detail["kredit"] - detail["debit"] if saldo_normal == "kredit" else detail["debit"] - detail["kredit"]
+    detail["saldo"] = mutasi.groupby(detail["nama_toko"], sort=False).cumsum()
+
+    ringkasan = detail.groupby("nama_toko", sort=False).agg(
+        total_debit=("debit", "sum"),
+        total_kredit=("kredit", "sum"),
+        saldo_akhir=("saldo", "last"),
+    ).reindex(pd.unique(nama_toko))
+    return detail[BP_KOLOM], ringkasan
+
+
+def buku_pembantu_shared(buku, akun, saldo_normal):
+    return cached_by_jurnal_version(
+        buku, f"jurnal:bp:{akun}",
+        lambda: build_buku_pembantu(load_posting_df(buku), akun, saldo_normal),
+    )
 
 
-def bp_piutang_page():
-    st.markdown("<h1 style='text-align:center;'>BUKU PEMBANTU PIUTANG (Per Pelanggan)</h1>", unsafe_allow_html=True)
-    st.write("Menampilkan piutang pelanggan berdasarkan transaksi Jurnal Umum.")
+def _buku_pembantu_page(judul, keterangan, akun, jenis, saldo_normal, label_pihak, warna):
+    st.markdown(f"<h1 style='text-align:center;'>{judul}</h1>", unsafe_allow_html=True)
+    st.write(keterangan)
 
-    # =========================
-    # LOAD DATA JURNAL
-    # =========================
-    df = load_jurnal_df()
-    if df.empty:
+    buku = buku_aktif()
+    if load_posting_df(buku).empty:
         st.info("Belum ada transaksi di jurnal.")
         return
 
+    detail, ringkasan = buku_pembantu_shared(buku, akun, saldo_normal)
+    if ringkasan.empty:
+        st.info(f"Belum ada transaksi {jenis}.")
+        return
+
     # =========================
-    # FILTER TRANSAKSI PIUTANG SAJA
+    # RINGKASAN SEMUA PIHAK
     # =========================
-    mask = (
-        (df["debit_akun"] == "Piutang Usaha") |
-        (df["kredit_akun"] == "Piutang Usaha") |
-        (df["jenis_transaksi"].str.lower() == "piutang")
+    tabel = pd.DataFrame({
+        label_pihak: ringkasan.index,
+        "Total Debit": format_rp_series(ringkasan["total_debit"]).to_numpy(),
+        "Total Kredit": format_rp_series(ringkasan["total_kredit"]).to_numpy(),
+        "Saldo Akhir": format_rp_series(ringkasan["saldo_akhir"]).to_numpy(),
+    })
+    pilihan = st.dataframe(
+        tabel,
+        hide_index=True,
+        width="stretch",
+        on_select="rerun",
+        selection_mode="multi-row",
+        # seleksi hanya berlaku untuk isi tabel ini: jurnal berubah = urutan pihak bisa bergeser
+        key=f"ringkasan_bp_{jenis}_{jurnal_version(buku)}",
     )
 
-    df_piutang = df[mask].copy()
-
-    if df_piutang.empty:
-        st.info("Belum ada transaksi piutang.")
-        return
-
     # =========================
-    # LIST PELANGGAN
+    # RINCIAN: hanya pihak yang dipilih yang dirender
     # =========================
-    pelanggan_list = df_piutang["nama_toko"].dropna().unique()
-
-    for pelanggan in pelanggan_list:
-
-        st.markdown(f"<h3 style='margin-top:35px;'><b>Pelanggan: {pelanggan}</b></h3>", unsafe_allow_html=True)
-
-        df_p = df_piutang[df_piutang["nama_toko"] == pelanggan].copy()
-        df_p.sort_values("tanggal", inplace=True)
-
-        saldo = 0
-        rows = []
-
-        # =========================
-        # HITUNG SALDO PER BARIS
-        # =========================
-        for _, r in df_p.iterrows():
-            debit = r["nilai"] if r["debit_akun"] == "Piutang Usaha" else 0
-            kredit = r["nilai"] if r["kredit_akun"] == "Piutang Usaha" else 0
-
-            saldo = saldo + debit - kredit
-
-            rows.append({
-                "Tanggal": r["tanggal"],
-                "Keterangan": r["deskripsi"],
-                "Debit": debit,
-                "Kredit": kredit,
-                "Saldo": saldo
-            })
-
-        # =========================
-        # TAMPILKAN TABEL
-        # =========================
-        df_display = pd.DataFrame(rows)
-
-        df_display["Debit"] = df_display["Debit"].apply(lambda x: f"Rp {x:,.0f}" if x != 0 else "")
-        df_display["Kredit"] = df_display["Kredit"].apply(lambda x: f"Rp {x:,.0f}" if x != 0 else "")
-        df_display["Saldo"] = df_display["Saldo"].apply(lambda x: f"Rp {x:,.0f}")
-
-        st.table(df_display)
-
-        # =========================
-        # HITUNG TOTAL
-        # =========================
-        # Perlu dikoreksi agar menggunakan nilai numerik dari rows
-        total_debit = sum([r.get("Debit", 0) for r in rows])
-        total_kredit = sum([r.get("Kredit", 0) for r in rows])
-        saldo_akhir = rows[-1]["Saldo"]
-
-        st.markdown(f"""
-        <div style='background:#f0f9ff;padding:12px;border-radius:8px;margin-bottom:20px;'>
-            <b>Total Debit:</b> Rp {total_debit:,.0f} &nbsp;&nbsp;
-            <b>Total Kredit:</b> Rp {total_kredit:,.0f} &nbsp;&nbsp;
-            <b>Saldo Akhir:</b> Rp {saldo_akhir:,.0f}
-        </div>
-        """, unsafe_allow_html=True)
+    terpilih = [ringkasan.index[i] for i in pilihan.selection.rows if i < len(ringkasan)]
+    if len(terpilih) == 0:
+        st.caption(f"Pilih {label_pihak.lower()} pada tabel di atas untuk melihat rinciannya.")
+
+    for pihak in terpilih:
+        r = ringkasan.loc[pihak]
+        with st.expander(f"{label_pihak}: {pihak}", expanded=True):
+            df_p = detail[detail["nama_toko"] == pihak]
+            st.dataframe(
+                pd.DataFrame({
+                    "Tanggal": df_p["tanggal"],
+                    "Keterangan": df_p["deskripsi"],
+                    "Debit": format_rp_series(df_p["debit"], kosong_nol=True),
+                    "Kredit": format_rp_series(df_p["kredit"], kosong_nol=True),
+                    "Saldo": format_rp_series(df_p["saldo"]),
+                }),
+                hide_index=True,
+                width="stretch",
+            )
+            st.markdown(f"""
+            <div style='background:{warna};padding:12px;border-radius:8px;margin-bottom:20px;'>
+                <b>Total Debit:</b> {format_rp(r["total_debit"])} &nbsp;&nbsp;
+                <b>Total Kredit:</b> {format_rp(r["total_kredit"])} &nbsp;&nbsp;
+                <b>Saldo Akhir:</b> {format_rp(r["saldo_akhir"])}
+            </div>
+            """, unsafe_allow_html=True)
 
     if st.button("⬅ Kembali Dashboard"):
         st.session_state['current_page'] = "Dashboard"
         st.rerun()
 
-def format_rp(x):
-    return f"Rp {x:,.0f}".replace(",", ".")
 
-# ---------------------------
-# Helper: load_jurnal_df (robust terhadap format tanggal)
-# ---------------------------
-def load_jurnal_df():
-    """
-    Mengambil jurnal_data dari st.session_state dan mengembalikan DataFrame
-    dengan kolom tanggal sebagai datetime (robust terhadap format).
-    """
-    if "jurnal_data" not in st.session_state:
-        return pd.DataFrame()
+def bp_utang_page():
+    _buku_pembantu_page(
+        "BUKU PEMBANTU UTANG (Per Supplier)",
+        "Menampilkan utang berdasarkan transaksi Jurnal Umum (akun Utang Usaha).",
+        akun="Utang Usaha", jenis="utang", saldo_normal="kredit",
+        label_pihak="Supplier", warna="#fef7e7",
+    )
 
-    df = pd.DataFrame(st.session_state["jurnal_data"])
-    if df.empty:
-        return pd.DataFrame()
-
-    # Pastikan kolom-kolom penting ada
-    for c in ["tanggal", "deskripsi", "debit_akun", "kredit_akun", "nilai", "jenis_transaksi", "nama_toko"]:
-        if c not in df.columns:
-            df[c] = ""
-
-    # Coba parse tanggal tanpa memaksa format spesifik
-    df["tanggal_parsed"] = pd.to_datetime(df["tanggal"], errors="coerce", dayfirst=False)
-    # Jika ada yang gagal parse, coba infer per-row
-    mask_na = df["tanggal_parsed"].isna()
-    if mask_na.any():
-        df.loc[mask_na, "tanggal_parsed"] = pd.to_datetime(df.loc[mask_na, "tanggal"].apply(lambda x: str(x)), infer_datetime_format=True, errors="coerce")
-    # fallback: buat tanggal hari ini jika masih NaT
-    df["tanggal_parsed"] = df["tanggal_parsed"].fillna(pd.Timestamp.today())
-    # replace original tanggal with parsed (but keep as datetime)
-    df["tanggal"] = df["tanggal_parsed"]
-    df = df.drop(columns=["tanggal_parsed"])
-    # pastikan nilai numeric
-    df["nilai"] = pd.to_numeric(df["nilai"], errors="coerce").fillna(0.0)
-    return df
+
+def bp_piutang_page():
+    _buku_pembantu_page(
+        "BUKU PEMBANTU PIUTANG (Per Pelanggan)",
+        "Menampilkan piutang pelanggan berdasarkan transaksi Jurnal Umum.",
+        akun="Piutang Usaha", jenis="piutang", saldo_normal="debit",
+        label_pihak="Pelanggan", warna="#f0f9ff",
+    )
 
 # ---------------------------
 # Helper: kategori akun untuk Laba Rugi
@@ -1081,55 +2527,175 @@ def classify_account_for_lr(akun_name: str):
         return "pendapatan"
     return "lain"
 
+
+_SALDO_NORMAL_FALLBACK = {"pendapatan": "kredit", "hpp": "debit", "beban": "debit", "lain": "debit"}
+
+
+def klasifikasi_akun(akun_index):
+    """
+    DataFrame (index = akun) berisi kategori (categorical, KATEGORI_AKUN) dan
+    saldo_normal. Akun terdaftar diambil dari DAFTAR_AKUN; sisanya lewat
+    classify_account_for_lr, satu kali per nama akun.
+    """
+    kategori, normal = [], []
+    for akun in akun_index:
+        if akun in DAFTAR_AKUN:
+            k, n = DAFTAR_AKUN[akun]
+        else:
+            k = classify_account_for_lr(akun)
+            n = _SALDO_NORMAL_FALLBACK[k]
+        kategori.append(k)
+        normal.append(n)
+    return pd.DataFrame(
+        {"kategori": pd.Categorical(kategori, categories=KATEGORI_AKUN), "saldo_normal": normal},
+        index=akun_index,
+    )
+
+
+def _dengan_klasifikasi(tb):
+    """
+    Tambahkan kolom kategori, saldo_normal dan saldo (debit - kredit untuk akun
+    bersaldo normal debit, kredit - debit untuk sebaliknya) ke tabel saldo
+    ber-index akun.
+    """
+    coa = klasifikasi_akun(tb.index)
+    saldo = np.where(coa["saldo_normal"] == "debit", tb["debit"] - tb["kredit"], tb["kredit"] - tb["debit"])
+    return tb.join(coa).assign(saldo=saldo)
+
+
+def trial_balance_klasifikasi(buku):
+    """trial_balance() yang sudah diklasifikasikan (lihat _dengan_klasifikasi)."""
+    return cached_by_jurnal_version(buku, "jurnal:saldo:kategori", lambda: _dengan_klasifikasi(trial_balance(buku)))
+
+
+def rollup_bulanan_df(buku):
+    """
+    Rollup akun x bulan (kolom akun, periode 'YYYY-MM', debit, kredit,
+    kategori, saldo_normal, saldo), dibaca dari tabel rollup_bulanan.
+    """
+    def _baca():
+        with db_conn(buku) as conn:
+            rows = conn.execute("SELECT akun, periode, debit, kredit FROM rollup_bulanan").fetchall()
+        df = pd.DataFrame([tuple(r) for r in rows], columns=["akun", "periode", "debit", "kredit"])
+        coa = klasifikasi_akun(pd.Index(df["akun"].unique()))
+        df = df.join(coa, on="akun")
+        df["saldo"] = np.where(df["saldo_normal"] == "debit", df["debit"] - df["kredit"], df["kredit"] - df["debit"])
+        return df
+
+    return cached_by_jurnal_version(buku, "jurnal:rollup", _baca)
+
+
+def saldo_rentang_periode(rollup, awal, akhir):
+    """Saldo per akun (format trial_balance_klasifikasi) untuk bulan awal..akhir."""
+    bagian = rollup[(rollup["periode"] >= awal) & (rollup["periode"] <= akhir)]
+    tb = bagian.groupby("akun")[["debit", "kredit"]].sum()
+    return _dengan_klasifikasi(tb)
+
+
+def laba_rugi_per_periode(rollup, tarif_pajak, per="bulan"):
+    """
+    Ringkasan laba rugi per bulan ('bulan') atau per tahun ('tahun') dari
+    rollup: baris = pos laporan, kolom = periode.
+    """
+    kunci = rollup["periode"] if per == "bulan" else rollup["periode"].str[:4]
+    total = (
+        rollup.groupby([kunci.rename("periode"), "kategori"], observed=False)["saldo"].sum()
+        .unstack("kategori", fill_value=0)
+        .sort_index()
+    )
+    hasil = pd.DataFrame(index=total.index)
+    hasil["Pendapatan"] = total["pendapatan"]
+    hasil["HPP"] = total["hpp"]
+    hasil["Laba Kotor"] = hasil["Pendapatan"] - hasil["HPP"]
+    hasil["Beban Operasional"] = total["beban"]
+    hasil["Laba Sebelum Pajak"] = hasil["Laba Kotor"] - hasil["Beban Operasional"]
+    hasil["Pajak"] = hasil["Laba Sebelum Pajak"].clip(lower=0) * tarif_pajak
+    hasil["Laba Bersih"] = hasil["Laba Sebelum Pajak"] - hasil["Pajak"]
+    return hasil.T
+
+
+def total_per_kategori(tbk):
+    """Total saldo per kategori akun dengan satu groupby categorical."""
+    return tbk.groupby("kategori", observed=False)["saldo"].sum()
+
 # ---------------------------
 # Laporan Laba Rugi Page (integrasi otomatis)
 # ---------------------------
 def laporan_laba_rugi_page():
     st.markdown("<h1 style='text-align:center;'>LAPORAN LABA RUGI</h1>", unsafe_allow_html=True)
 
-    df = load_jurnal_df()
-    if df.empty:
+    buku = buku_aktif()
+    tbk = trial_balance_klasifikasi(buku)
+    if tbk.empty:
         st.info("Belum ada transaksi pada jurnal.")
         return
 
-    pendapatan = df[
-        (df["debit_akun"].str.contains("Kas", case=False)) &
-        (df["kredit_akun"].str.contains("Penjualan", case=False))
-    ]["nilai"].sum()
+    # ============================
+    # PILIHAN PERIODE (semua dari rollup bulanan)
+    # ============================
+    rollup = rollup_bulanan_df(buku)
+    periode_list = sorted(rollup["periode"].unique())
+
+    col_mode, col_pajak = st.columns([3, 1])
+    with col_mode:
+        mode = st.radio(
+            "Periode",
+            ["Semua Periode", "Rentang Bulan", "Per Bulan", "Tahun ke Tahun"],
+            horizontal=True,
+            key="lr_mode",
+        )
+    with col_pajak:
+        tarif_persen = st.number_input("Tarif Pajak (%)", min_value=0.0, max_value=100.0, value=10.0, step=0.5, key="lr_tarif")
+    tarif_pajak = tarif_persen / 100
+
+    if mode in ("Per Bulan", "Tahun ke Tahun"):
+        tabel = laba_rugi_per_periode(rollup, tarif_pajak, per="bulan" if mode == "Per Bulan" else "tahun")
+        if mode == "Tahun ke Tahun" and tabel.shape[1] >= 2:
+            lalu, kini = tabel.columns[-2], tabel.columns[-1]
+            perubahan = (tabel[kini] - tabel[lalu]) / tabel[lalu].abs().replace(0, np.nan) * 100
+        else:
+            perubahan = None
+        tampil = tabel.apply(format_rp_series)
+        if perubahan is not None:
+            tampil[f"Perubahan {lalu}→{kini}"] = perubahan.map(lambda x: "-" if pd.isna(x) else f"{x:+.1f}%")
+        st.dataframe(tampil, width="stretch")
+
+        if st.button("⬅ Kembali Dashboard"):
+            st.session_state["current_page"] = "Dashboard"
+            st.rerun()
+        return
+
+    if mode == "Rentang Bulan" and periode_list:
+        awal, akhir = st.select_slider(
+            "Dari - Sampai Bulan",
+            options=periode_list,
+            value=(periode_list[0], periode_list[-1]),
+            key="lr_rentang",
+        )
+        tbk = saldo_rentang_periode(rollup, awal, akhir)
+        st.caption(f"Periode {awal} s/d {akhir}")
 
-    df_hpp = df[
-        (df["debit_akun"].str.contains("HPP", case=False, na=False)) |
-        (df["kredit_akun"].str.contains("HPP", case=False, na=False))
-    ]
-    nilai_hpp = df_hpp["nilai"].sum()
+    total = total_per_kategori(tbk)
+    pendapatan = total["pendapatan"]
+    nilai_hpp = total["hpp"]
 
     laba_kotor = pendapatan - nilai_hpp
 
-    df_beban = df[
-        df["debit_akun"].str.contains("Beban", case=False, na=False)
-    ]
-    beban_operasional = df_beban["nilai"].sum()
-    list_beban = df_beban.groupby("debit_akun")["nilai"].sum().reset_index()
+    beban_operasional = total["beban"]
+    tb_beban = tbk[(tbk["kategori"] == "beban") & (tbk["saldo"] != 0)]
+    list_beban = tb_beban["saldo"].rename("nilai").rename_axis("debit_akun").sort_index().reset_index()
 
     laba_sebelum_pajak = laba_kotor - beban_operasional
 
-    pajak = laba_sebelum_pajak * 0.10 if laba_sebelum_pajak > 0 else 0
+    pajak = laba_sebelum_pajak * tarif_pajak if laba_sebelum_pajak > 0 else 0
 
     laba_bersih = laba_sebelum_pajak - pajak
-    st.markdown("""
-        <style>
-            .lr-title {font-size:20px; font-weight:bold; margin-top:25px;}
-            .lr-row {display:flex; justify-content:space-between; padding:6px 0;}
-            .lr-bold {font-weight:bold;}
-            .lr-box {background:#f1f7ff; padding:15px; border-radius:8px; margin-top:20px;}
-        </style>
-    """, unsafe_allow_html=True)
 
     st.markdown("<div class='lr-title'>Pendapatan</div>", unsafe_allow_html=True)
     st.markdown(f"""
         <div class='lr-row'>
             <span>Pendapatan Usaha</span>
-            <span>Rp {pendapatan:,.0f}</span>
+            <span>{format_rp(pendapatan)}</span>
         </div>
     """, unsafe_allow_html=True)
 
@@ -1137,7 +2703,7 @@ def laporan_laba_rugi_page():
     st.markdown(f"""
         <div class='lr-row lr-bold'>
             <span>Total HPP</span>
-            <span>Rp {nilai_hpp:,.0f}</span>
+            <span>{format_rp(nilai_hpp)}</span>
         </div>
     """, unsafe_allow_html=True)
 
@@ -1148,7 +2714,7 @@ def laporan_laba_rugi_page():
     st.markdown(f"""
         <div class='lr-row lr-bold'>
             <span>Laba Kotor (Penjualan - HPP)</span>
-            <span>Rp {laba_kotor:,.0f}</span>
+            <span>{format_rp(laba_kotor)}</span>
         </div>
     """, unsafe_allow_html=True)
 
@@ -1162,14 +2728,14 @@ def laporan_laba_rugi_page():
             st.markdown(f"""
                 <div class='lr-row'>
                     <span>{row['debit_akun']}</span>
-                    <span>Rp {row['nilai']:,.0f}</span>
+                    <span>{format_rp(row['nilai'])}</span>
                 </div>
             """, unsafe_allow_html=True)
 
     st.markdown(f"""
         <div class='lr-row lr-bold'>
             <span>Total Beban Operasional</span>
-            <span>Rp {beban_operasional:,.0f}</span>
+            <span>{format_rp(beban_operasional)}</span>
         </div>
     """, unsafe_allow_html=True)
 
@@ -1180,18 +2746,18 @@ def laporan_laba_rugi_page():
     st.markdown(f"""
         <div class='lr-row lr-bold'>
             <span>Laba Sebelum Pajak</span>
-            <span>Rp {laba_sebelum_pajak:,.0f}</span>
+            <span>{format_rp(laba_sebelum_pajak)}</span>
         </div>
     """, unsafe_allow_html=True)
 
     # ============================
     # PAJAK
     # ============================
-    st.markdown("<div class='lr-title'>Pajak (10%)</div>", unsafe_allow_html=True)
+    st.markdown(f"<div class='lr-title'>Pajak ({tarif_persen:g}%)</div>", unsafe_allow_html=True)
     st.markdown(f"""
         <div class='lr-row lr-bold'>
             <span>Pajak Penghasilan</span>
-            <span>Rp {pajak:,.0f}</span>
+            <span>{format_rp(pajak)}</span>
         </div>
     """, unsafe_allow_html=True)
 
@@ -1202,7 +2768,7 @@ def laporan_laba_rugi_page():
     st.markdown(f"""
         <div class='lr-row lr-bold'>
             <span>Laba Bersih</span>
-            <span>Rp {laba_bersih:,.0f}</span>
+            <span>{format_rp(laba_bersih)}</span>
         </div>
     """, unsafe_allow_html=True)
 
@@ -1210,74 +2776,6 @@ def laporan_laba_rugi_page():
         st.session_state["current_page"] = "Dashboard"
         st.rerun()
 
-def build_inventory_card(records):
-    """
-    Inventory dengan metode Average Cost (Harga Pokok Rata-Rata Bergerak)
-    • Tidak ada koma desimal
-    • Harga & HPP dibulatkan ke rupiah
-    """
-
-    if not records:
-        return pd.DataFrame(), 0, 0
-
-    rows = []
-    saldo_qty = 0       # total unit
-    saldo_rp = 0        # total nilai persediaan
-    avg_cost = 0        # harga rata-rata
-
-    for r in records:
-        tgl = r["tanggal"]
-        ket = r["keterangan"]
-        tipe = r["tipe"]
-        qty = float(r["qty"])
-        nilai = float(r["nilai"])
-
-        harga_unit = ""
-        hpp_total = ""
-
-        # ----------------------------
-        # MASUK (update average cost)
-        # ----------------------------
-        if tipe == "Masuk":
-            harga_unit = nilai / qty if qty > 0 else 0
-
-            saldo_rp += nilai
-            saldo_qty += qty
-
-            # harga rata-rata bergerak
-            avg_cost = saldo_rp / saldo_qty if saldo_qty > 0 else 0
-
-        # ----------------------------
-        # KELUAR (HPP pakai avg cost)
-        # ----------------------------
-        elif tipe == "Keluar":
-            harga_unit = avg_cost
-            hpp_total = qty * avg_cost
-
-            saldo_qty -= qty
-            saldo_rp -= hpp_total
-
-            if saldo_qty < 0:
-                saldo_qty = 0
-                saldo_rp = 0
-
-        # ----------------------------
-        # TAMPILKAN TANPA KOMA
-        # ----------------------------
-        rows.append({
-            "Tanggal": tgl,
-            "Keterangan": ket,
-            "Masuk (Qty)": int(qty) if tipe == "Masuk" else "",
-            "Keluar (Qty)": int(qty) if tipe == "Keluar" else "",
-            "Harga/Unit": f"Rp {int(harga_unit):,}".replace(",", "."),
-            "HPP": f"Rp {int(hpp_total):,}".replace(",", ".") if hpp_total != "" else "",
-            "Saldo (Qty)": int(saldo_qty),
-            "Saldo (Rp)": f"Rp {int(saldo_rp):,}".replace(",", ".")
-        })
-
-    df = pd.DataFrame(rows)
-    return df, saldo_qty, saldo_rp
-
 # =====================================================================
 #  INVENTORY — AVERAGE COST METHOD (2 Jenis: Bibit & Jangkrik Panen)
 # =====================================================================
@@ -1289,121 +2787,9 @@ def build_inventory_card(records):
 # -------------------------
 # INVENTORY (Average) - Single inventory
 # -------------------------
-import json
-import os
-import streamlit as st
-import pandas as pd
-
-# ============================
-# CUSTOM STYLE (warna UI)
-# ============================
-st.markdown("""
-    <style>
-        /* Card box background */
-        .stApp {
-            background-color: #f6fbff;
-        }
-
-        /* Riwayat Transaksi box */
-        .riwayat-box {
-            background: #ffffff;
-            padding: 18px;
-            border-radius: 12px;
-            border-left: 5px solid #4bb3fd;
-            margin-bottom: 12px;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.05);
-        }
-
-        /* Delete button style */
-        .delete-btn button {
-            background-color: #ff6b6b !important;
-            color: white !important;
-            border-radius: 8px !important;
-        }
-
-        /* Inventory table header */
-        thead tr th {
-            background-color: #4bb3fd !important;
-            color: white !important;
-            font-weight: 600 !important;
-            text-align:center !important;
-        }
-
-        tbody tr td {
-            text-align:center !important;
-        }
-
-        /* Total box */
-        .total-box {
-            background: #e9f7ff;
-            padding: 15px;
-            border-radius: 10px;
-            border: 1px solid #bde4ff;
-            font-size: 17px;
-        }
-    </style>
-""", unsafe_allow_html=True)
-
-
-INVENTORY_FILE = "inventory_data.json"
-
-def load_inventory_data():
-    """
-    Load inventory from file if exists, else from session_state default.
-    This returns a dict with key "Records" (single inventory).
-    """
-    # prefer session state during runtime so edits persist in a session
-    if "inventory_data" in st.session_state:
-        data = st.session_state["inventory_data"]
-    else:
-        # try load from file
-        if os.path.exists(INVENTORY_FILE):
-            try:
-                with open(INVENTORY_FILE, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-            except Exception:
-                data = {"Records": []}
-        else:
-            data = {"Records": []}
-        st.session_state["inventory_data"] = data
-
-    # ensure structure
-    if not isinstance(st.session_state["inventory_data"], dict):
-        st.session_state["inventory_data"] = {"Records": []}
-    if "Records" not in st.session_state["inventory_data"]:
-        st.session_state["inventory_data"]["Records"] = []
-
-    return st.session_state["inventory_data"]
-
-
-def save_inventory_data(data=None):
-    """
-    Save inventory to session_state and file.
-    If data provided, use it; otherwise use session_state.
-    """
-    if data is not None:
-        st.session_state["inventory_data"] = data
-    data_to_save = st.session_state.get("inventory_data", {"Records": []})
-    try:
-        with open(INVENTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(data_to_save, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        # non-fatal in UI; log to console
-        print("Failed to save inventory file:", e)
-
-
-def delete_inventory_record(index):
-    data = load_inventory_data()
-    try:
-        records = data["Records"]
-        if 0 <= index < len(records):
-            records.pop(index)
-            save_inventory_data(data)
-    except Exception as e:
-        print("delete_inventory_record error:", e)
 
 
-def build_inventory_average(records):
+def build_inventory_average(records, awal=(0, 0, 0)):
     """
     records: list of dicts with keys:
       - tanggal (str)
@@ -1411,57 +2797,24 @@ def build_inventory_average(records):
       - tipe ("Masuk" or "Keluar")
       - qty (int)
       - nilai (int)
+    awal: state (saldo_qty, saldo_rp, avg_cost) sebelum record pertama,
+    mis. dari checkpoint inventory.
     Returns (df, saldo_qty, saldo_rp)
     All amounts are integers (no decimal).
     """
+    state = awal
     if not records:
-        return pd.DataFrame(), 0, 0
+        return pd.DataFrame(), state[0], state[1]
 
     rows = []
-    saldo_qty = 0
-    saldo_rp = 0
-    avg_cost = 0
-
     for r in records:
-        tgl = r.get("tanggal", "")
-        ket = r.get("keterangan", "")
-        tipe = r.get("tipe", "")
-        try:
-            qty = int(r.get("qty", 0) or 0)
-        except Exception:
-            qty = 0
-        try:
-            nilai = int(r.get("nilai", 0) or 0)
-        except Exception:
-            nilai = 0
-
-        harga_unit = ""
-        hpp = ""
-
-        # MASUK -> update average
-        if tipe == "Masuk":
-            if qty > 0:
-                harga_unit = nilai // qty
-            else:
-                harga_unit = 0
-            saldo_rp += nilai
-            saldo_qty += qty
-            avg_cost = (saldo_rp // saldo_qty) if saldo_qty > 0 else 0
-
-        # KELUAR -> pakai avg cost
-        elif tipe == "Keluar":
-            harga_unit = avg_cost
-            hpp = qty * avg_cost
-            saldo_qty -= qty
-            saldo_rp -= hpp
-            if saldo_qty < 0:
-                saldo_qty = 0
-            if saldo_rp < 0:
-                saldo_rp = 0
+        _, _, tipe, qty, nilai, _, _ = _inventory_row(r)
+        state, harga_unit, hpp = _inventory_step(state, tipe, qty, nilai)
+        saldo_qty, saldo_rp, _ = state
 
         rows.append({
-            "Tanggal": tgl,
-            "Keterangan": ket,
+            "Tanggal": r.get("tanggal", ""),
+            "Keterangan": r.get("keterangan", ""),
             "Masuk": qty if tipe == "Masuk" else "",
             "Keluar": qty if tipe == "Keluar" else "",
             "Harga/Unit": int(harga_unit) if harga_unit != "" else "",
@@ -1471,20 +2824,22 @@ def build_inventory_average(records):
         })
 
     df = pd.DataFrame(rows)
-    return df, saldo_qty, saldo_rp
+    return df, state[0], state[1]
 
 
 def inventory_page():
     """
-    UI for inventory — single inventory, average cost, add/delete.
+    UI for inventory — kartu average cost per item x lokasi, add/delete.
     """
     st.title("📦 Inventory (Average Method)")
 
-    data = load_inventory_data()  # ensures session state key exists
-    records = data["Records"]
+    valuasi = inventory_valuasi()
+    daftar_lokasi = list(dict.fromkeys(INVENTORY_LOKASI + valuasi["lokasi"].tolist()))
 
     st.subheader("➕ Tambah Transaksi")
     tanggal = st.date_input("Tanggal")
+    item = st.selectbox("Item", INVENTORY_ITEM, index=INVENTORY_ITEM.index(INVENTORY_ITEM_DEFAULT))
+    lokasi = st.selectbox("Lokasi", daftar_lokasi, accept_new_options=True)
     keterangan = st.text_input("Keterangan")
     tipe = st.selectbox("Tipe", ["Masuk", "Keluar"])
     qty = st.number_input("Qty", min_value=1, step=1)
@@ -1492,40 +2847,68 @@ def inventory_page():
 
     if st.button("Simpan"):
         # Append as integers to keep display clean (no decimals)
-        rec = {
+        inventory_insert({
             "tanggal": str(tanggal),
             "keterangan": keterangan,
             "tipe": tipe,
             "qty": int(qty),
-            "nilai": int(nilai)
-        }
-        records.append(rec)
-        save_inventory_data(data)
+            "nilai": int(nilai),
+            "item": item,
+            "lokasi": (lokasi or INVENTORY_LOKASI_DEFAULT).strip()
+        })
         st.success("Transaksi disimpan!")
         st.rerun()
 
-    st.subheader("📄 Riwayat Transaksi")
-    if records:
-        # show records with delete buttons
-        for i, r in enumerate(records):
-            cols = st.columns([6, 1])
-            with cols[0]:
-                st.write(f"**{r.get('tanggal','')} - {r.get('keterangan','')}**  \nTipe: {r.get('tipe','')} | Qty: {r.get('qty',0)} | Nilai: {r.get('nilai',0)}")
-            with cols[1]:
-                if st.button("❌", key=f"del_{i}"):
-                    delete_inventory_record(i)
-                    st.warning("Transaksi dihapus!")
-                    st.rerun()
-    else:
+    if valuasi.empty:
+        st.subheader("📊 Kartu Persediaan")
         st.info("Belum ada transaksi.")
+        return
+
+    st.subheader("💰 Nilai Persediaan")
+    st.dataframe(
+        valuasi.rename(columns={
+            "item": "Item", "lokasi": "Lokasi", "transaksi": "Transaksi",
+            "saldo_qty": "Saldo Qty", "saldo_rp": "Saldo Rp", "avg_cost": "Harga Rata-rata",
+        }),
+        hide_index=True, width="stretch",
+    )
+    per_item = valuasi.groupby("item")[["saldo_qty", "saldo_rp"]].sum()
+    st.info("  \n".join(
+        f"**{i}:** {int(r.saldo_qty)} unit — Rp {int(r.saldo_rp):,}".replace(",", ".")
+        for i, r in per_item.iterrows()
+    ) + f"  \n**Total Nilai Persediaan:** Rp {int(valuasi['saldo_rp'].sum()):,}".replace(",", "."))
 
     st.subheader("📊 Kartu Persediaan")
-    df, qty_total, nilai_total = build_inventory_average(records)
-    st.table(df)
+    kartu = list(zip(valuasi["item"], valuasi["lokasi"]))
+    item, lokasi = st.selectbox("Kartu", kartu, format_func=lambda k: f"{k[0]} — {k[1]}")
+    total, qty_total, nilai_total = inventory_saldo_akhir(item, lokasi)
+
+    jumlah_halaman = max(1, -(-total // INVENTORY_PAGE_SIZE))
+    # key ikut kartu & jumlah halaman agar kembali ke halaman terakhir setelah tambah/hapus
+    halaman = st.number_input(
+        f"Halaman (1–{jumlah_halaman}, {total} transaksi)",
+        min_value=1, max_value=jumlah_halaman, value=jumlah_halaman, step=1,
+        key=f"inv_halaman_{item}_{lokasi}_{jumlah_halaman}",
+    )
+    df, ids = inventory_card_page(item, lokasi, halaman)
+    # kolom campuran angka/"" ditampilkan sebagai teks (Arrow menolak tipe campuran)
+    df = df.astype({k: str for k in ("Masuk", "Keluar", "Harga/Unit", "HPP")})
+    # seleksi hanya berlaku untuk isi tabel ini: ganti halaman/isi persediaan = tabel baru tanpa seleksi
+    pilihan = st.dataframe(
+        df, hide_index=True, width="stretch", on_select="rerun", selection_mode="multi-row",
+        key=f"tabel_inventory_{item}_{lokasi}_{int(halaman)}_{inventory_version()}",
+    )
+    terpilih = [ids[i] for i in pilihan.selection.rows if i < len(ids)]
+    if terpilih and st.button(f"🗑️ Hapus {len(terpilih)} transaksi terpilih"):
+        jumlah = sum(delete_inventory_record(record_id) for record_id in terpilih)
+        if jumlah == len(terpilih):
+            st.rerun()
+        st.warning(f"{len(terpilih) - jumlah} transaksi sudah dihapus oleh pengguna lain; muat ulang tabel.")
+
     st.info(f"**Saldo Akhir Qty:** {int(qty_total)}  \n**Saldo Akhir Rp:** {int(nilai_total)}")
 
 
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
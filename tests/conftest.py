@@ -0,0 +1,48 @@
+import importlib
+import json
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ASET = [".streamlit", "static", "app.py", "jurnal_data.json", "inventory_data.json",
+        "maskot.png", "profile_placeholder.png"]
+# akun uji, dimasukkan lewat jalur migrasi users.json (file dihapus app setelah migrasi)
+PENGUJI = ("penguji", "rahasia-uji")
+
+
+def salin_app(tujuan):
+    """Salin app + data awal ke `tujuan` agar database/Excel hasil run tidak mengotori working tree."""
+    for nama in ASET:
+        asal = os.path.join(REPO, nama)
+        if os.path.isdir(asal):
+            shutil.copytree(asal, os.path.join(tujuan, nama))
+        elif os.path.exists(asal):
+            shutil.copy(asal, os.path.join(tujuan, nama))
+    with open(os.path.join(tujuan, "users.json"), "w", encoding="utf-8") as f:
+        json.dump(dict([PENGUJI]), f)
+    return tujuan
+
+
+@pytest.fixture
+def salinan_app(tmp_path, monkeypatch):
+    salin_app(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture(scope="session")
+def app_modul(tmp_path_factory):
+    """Modul app diimpor sekali (bare mode) dari salinan di direktori sementara."""
+    folder = salin_app(tmp_path_factory.mktemp("app"))
+    asal = os.getcwd()
+    os.chdir(folder)
+    sys.path.insert(0, str(folder))
+    try:
+        yield importlib.import_module("app")
+    finally:
+        sys.path.remove(str(folder))
+        sys.modules.pop("app", None)
+        os.chdir(asal)
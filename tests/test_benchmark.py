@@ -0,0 +1,50 @@
+"""
+Benchmark startup SIJANG: impor modul (cold start, termasuk migrasi data awal)
+dan rerun Dashboard setelah login harus tetap di bawah anggaran waktu tetap.
+Dijalankan pada salinan repo di direktori sementara (fixture salinan_app).
+"""
+import subprocess
+import sys
+import time
+
+from streamlit.testing.v1 import AppTest
+
+from conftest import PENGUJI
+
+# anggaran (detik); longgar terhadap variasi mesin, ketat terhadap regresi
+# seperti data contoh atau impor berat yang kembali ke jalur startup
+BUDGET_IMPORT = 5.0
+BUDGET_RERUN = 1.0
+RERUN_ULANG = 5
+
+
+def test_import_app_cold_start(salinan_app):
+    # proses baru: tidak ada modul/cache yang sudah hangat dari test lain
+    mulai = time.perf_counter()
+    hasil = subprocess.run(
+        [sys.executable, "-c", "import app"],
+        cwd=salinan_app, capture_output=True, text=True, timeout=120,
+    )
+    durasi = time.perf_counter() - mulai
+    assert hasil.returncode == 0, hasil.stderr
+    assert durasi < BUDGET_IMPORT, f"import app {durasi:.2f}s > {BUDGET_IMPORT}s"
+
+
+def test_dashboard_rerun(salinan_app):
+    at = AppTest.from_file(str(salinan_app / "app.py"), default_timeout=60)
+    at.run()
+    at.text_input(key="login_user").input(PENGUJI[0])
+    at.text_input(key="login_pass").input(PENGUJI[1])
+    next(b for b in at.button if b.label == "Login").click()
+    at.run()
+    assert not at.exception, [e.value for e in at.exception]
+    assert at.session_state["authenticated"]
+
+    durasi = []
+    for _ in range(RERUN_ULANG):
+        mulai = time.perf_counter()
+        at.run()
+        durasi.append(time.perf_counter() - mulai)
+        assert not at.exception, [e.value for e in at.exception]
+    median = sorted(durasi)[len(durasi) // 2]
+    assert median < BUDGET_RERUN, f"rerun Dashboard {median:.2f}s > {BUDGET_RERUN}s"
@@ -0,0 +1,64 @@
+"""validasi_import: tanggal hanya format eksplisit, nilai berformat angka Indonesia."""
+import pandas as pd
+import pytest
+
+
+def _validasi(app_modul, kolom):
+    n = len(next(iter(kolom.values())))
+    df = pd.DataFrame({"tanggal": ["2025-01-05"] * n, "debit_akun": ["Kas"] * n,
+                       "kredit_akun": ["Penjualan"] * n, "nilai": ["1000"] * n, **kolom})
+    valid, kesalahan = app_modul.validasi_import(df, 2, "tester")
+    return pd.DataFrame(valid), kesalahan
+
+
+@pytest.mark.parametrize("teks, diharapkan", [
+    ("2025-01-05", "2025-01-05"),
+    ("2025-01-05 00:00:00", "2025-01-05"),   # sel tanggal XLSX
+    ("31/12/2025", "2025-12-31"),
+    ("01/02/2025", "2025-02-01"),
+    ("05-01-2025", "2025-01-05"),
+])
+def test_tanggal_format_eksplisit(app_modul, teks, diharapkan):
+    valid, kesalahan = _validasi(app_modul, {"tanggal": [teks]})
+    assert kesalahan.empty
+    assert valid["tanggal"].tolist() == [diharapkan]
+
+
+@pytest.mark.parametrize("teks", ["2025-13-01", "13.01.2025", "12/31/2025", "2025-02-30", "2025-01", "5 Jan 2025"])
+def test_tanggal_tidak_valid_ditolak(app_modul, teks):
+    valid, kesalahan = _validasi(app_modul, {"tanggal": [teks]})
+    assert valid.empty
+    assert kesalahan["Kesalahan"].tolist() == ["tanggal kosong/tidak valid"]
+
+
+@pytest.mark.parametrize("teks, diharapkan", [
+    ("250000", 250000),
+    ("250.000", 250000),
+    ("Rp 1.234.567", 1234567),
+    ("Rp. 1.234.567,50", 1234567.5),
+    ("Rp1.000", 1000),
+    ("12,5", 12.5),
+])
+def test_nilai_format_indonesia(app_modul, teks, diharapkan):
+    valid, kesalahan = _validasi(app_modul, {"nilai": [teks]})
+    assert kesalahan.empty
+    assert valid["nilai"].tolist() == [diharapkan]
+
+
+@pytest.mark.parametrize("teks", ["250.00", "1,234.5", "1.23.456", "1.234,", "abc", ""])
+def test_nilai_ambigu_ditolak(app_modul, teks):
+    valid, kesalahan = _validasi(app_modul, {"nilai": [teks]})
+    assert valid.empty
+    assert kesalahan["Kesalahan"].tolist() == ["nilai bukan angka"]
+
+
+def test_nomor_baris_dan_baris_kosong(app_modul):
+    df = pd.DataFrame({
+        "tanggal": ["2025-01-05", "", "2025-13-01"],
+        "debit_akun": ["Kas", "", "Kas"],
+        "kredit_akun": ["Penjualan", "", "Penjualan"],
+        "nilai": ["1.000", "", "1.000"],
+    })
+    valid, kesalahan = app_modul.validasi_import(df, 2, "tester")
+    assert len(pd.DataFrame(valid)) == 1
+    assert kesalahan["Baris"].tolist() == [4]
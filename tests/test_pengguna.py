@@ -0,0 +1,26 @@
+"""Migrasi users.json: password hanya tersimpan sebagai hash, tanpa akun bawaan tetap."""
+import os
+import re
+import sqlite3
+
+from conftest import PENGUJI
+
+
+def test_users_json_dihapus_setelah_migrasi(app_modul):
+    assert not os.path.exists(app_modul.USER_DB_FILE)
+    assert app_modul.verifikasi_pengguna(*PENGUJI) == app_modul.BUKU_UTAMA
+    assert app_modul.verifikasi_pengguna(PENGUJI[0], "salah") is None
+    assert app_modul.verifikasi_pengguna("rivaldo123", "password123") is None
+
+
+def test_instalasi_baru_akun_awal_password_acak(app_modul, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)   # tanpa users.json
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(app_modul.PENGGUNA_SCHEMA)
+    app_modul._migrasi_pengguna_json(conn)
+    password = re.search(r"password '([^']+)'", capsys.readouterr().out).group(1)
+
+    rows = conn.execute("SELECT username, password_hash FROM pengguna").fetchall()
+    assert [r[0] for r in rows] == [app_modul.PENGGUNA_AWAL]
+    assert password not in rows[0][1]
+    assert app_modul.cek_password(password, rows[0][1])